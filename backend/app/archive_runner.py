@@ -0,0 +1,30 @@
+import asyncio
+import argparse
+from app.core.config import get_settings
+from app.services.archive import archive
+from app.tasks.replay import replay_city
+
+settings = get_settings()
+
+async def main():
+    parser = argparse.ArgumentParser(description='Request archive maintenance')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help='rebuild the Redis working set from the archive')
+    replay_parser.add_argument('city', help="city name or 'all'")
+
+    args = parser.parse_args()
+
+    if not archive.enabled:
+        parser.error('ARCHIVE_PATH is not set')
+
+    cities = list(settings.cities) if args.city == 'all' else [args.city]
+    for city in cities:
+        if city not in settings.cities:
+            parser.error(f'Unknown city: {city}')
+
+    for city in cities:
+        print(city, await replay_city(city))
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import asyncio
+import argparse
+from datetime import datetime, timezone, timedelta
+from app.core.config import get_settings
+from app.services.georeport_client import fetch_open_requests, close_clients
+from app.services.media import close_client as close_media_client
+from app.services.batch_classifier import submit_batch, collect_batch, strip_classification
+from app.services.archive import archive
+import app.services.cache as cache
+
+settings = get_settings()
+
+async def backfill(city: str, days: int) -> str | None:
+    end_date = datetime.now(timezone.utc)
+    start_date = end_date - timedelta(days=days)
+    requests = []
+    page = 1
+
+    while True:
+        page_requests = await fetch_open_requests(
+            city,
+            start_date=start_date,
+            end_date=end_date,
+            page=page,
+            page_size=100
+        )
+        if not page_requests:
+            break
+        by_id = {str(r['service_request_id']): r for r in page_requests}
+        uncached_ids = await cache.filter_uncached(city, list(by_id))
+        requests += [by_id[req_id] for req_id in uncached_ids]
+        page += 1
+
+    return await submit_batch(city, requests)
+
+async def rescore(city: str) -> str | None:
+    requests = [strip_classification(payload) for payload in await cache.mget_requests(city)]
+    return await submit_batch(city, requests)
+
+async def main():
+    parser = argparse.ArgumentParser(description='Bulk classification through the OpenAI Batch API')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = commands.add_parser('backfill', help='classify every uncached open request in a window')
+    backfill_parser.add_argument('city')
+    backfill_parser.add_argument('--days', type=int, default=1)
+    backfill_parser.add_argument('--no-wait', action='store_true')
+
+    rescore_parser = commands.add_parser('rescore', help='re-classify every cached request, e.g. after a prompt change')
+    rescore_parser.add_argument('city', help="city name or 'all'")
+    rescore_parser.add_argument('--no-wait', action='store_true')
+
+    collect_parser = commands.add_parser('collect', help='wait for a submitted batch and cache its results')
+    collect_parser.add_argument('batch_id')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'collect':
+            await collect_batch(args.batch_id)
+            return
+
+        cities = list(settings.cities) if args.command == 'rescore' and args.city == 'all' else [args.city]
+        for city in cities:
+            if city not in settings.cities:
+                parser.error(f'Unknown city: {city}')
+
+        if args.command == 'backfill':
+            batch_ids = [await backfill(args.city, args.days)]
+        else:
+            batch_ids = [await rescore(city) for city in cities]
+
+        batch_ids = [batch_id for batch_id in batch_ids if batch_id]
+        if args.no_wait:
+            for batch_id in batch_ids:
+                print(batch_id)
+            return
+
+        await asyncio.gather(*(collect_batch(batch_id) for batch_id in batch_ids))
+    finally:
+        await close_clients()
+        await close_media_client()
+        await archive.close()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,241 @@
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+import httpx
+from app.core.config import get_settings
+from app.services.georeport_client import get_base_url, close_clients
+from app.services.archive import archive
+from app.tasks.ingest import full_sweep, poll_once
+from app.tasks.scheduler import PollScheduler
+import app.services.cache as cache
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('bench')
+
+settings = get_settings()
+
+VISIBILITY_TIMEOUT = 120
+VISIBILITY_CHECK_INTERVAL = 0.02
+
+def percentile(values: list[float], pct: float) -> float | None:
+    # nearest rank, so the value reported is one that was actually observed
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+def summarize(values: list[float]) -> dict:
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+        'mean': sum(values) / len(values) if values else None
+    }
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+async def redis_memory() -> int | None:
+    try:
+        return int((await cache.redis.info('memory'))['used_memory'])
+    except Exception:
+        return None
+
+async def reset_city(city: str) -> None:
+    # start cold: drop everything cached for the city, but leave other cities alone
+    await cache.evict_requests(city, list(await cache.get_cached_ids(city)))
+    await cache.redis.delete(cache.watermark_key(city))
+
+async def seed(city: str, args) -> dict:
+    async with httpx.AsyncClient(base_url=get_base_url(city), timeout=600) as client:
+        (await client.post('/reset')).raise_for_status()
+        response = await client.post('/seed', params={
+            'count': args.count,
+            'days': args.days,
+            'open_ratio': args.open_ratio,
+            'seed': args.seed,
+            # fresh descriptions each run, so the classification cache does not hide the model
+            'tag': f'run {int(time.time())}'
+        })
+        response.raise_for_status()
+        return response.json()
+
+async def bench_ingest(city: str) -> dict:
+    memory_before = await redis_memory()
+    start = time.perf_counter()
+    await full_sweep(city)
+    elapsed = time.perf_counter() - start
+
+    cached = len(await cache.get_cached_ids(city))
+    memory_after = await redis_memory()
+    memory = None
+    if memory_before is not None and memory_after is not None:
+        memory = {
+            'used_bytes': memory_after,
+            'added_bytes': memory_after - memory_before,
+            'bytes_per_request': (memory_after - memory_before) / cached if cached else None
+        }
+
+    return {
+        'cached_requests': cached,
+        'seconds': elapsed,
+        'requests_per_second': cached / elapsed if elapsed else None,
+        'redis_memory': memory
+    }
+
+async def bench_visibility(city: str, probes: int, spacing: float) -> dict:
+    # time from creating a report upstream until the running scheduler has it in Redis
+    scheduler = PollScheduler(poll_once)
+    scheduler.add(city)
+    poller = asyncio.create_task(scheduler.run())
+    latencies = []
+    timeouts = 0
+
+    async def probe(client: httpx.AsyncClient, delay: float):
+        nonlocal timeouts
+        await asyncio.sleep(delay)
+        response = await client.post('/requests', json={
+            'service_code': '1',
+            'description': f'benchmark probe {time.time()}'
+        })
+        response.raise_for_status()
+        created = time.perf_counter()
+        req_id = response.json()['service_request_id']
+
+        while time.perf_counter() - created < VISIBILITY_TIMEOUT:
+            if await cache.is_cached(city, req_id):
+                latencies.append(time.perf_counter() - created)
+                return
+            await asyncio.sleep(VISIBILITY_CHECK_INTERVAL)
+        timeouts += 1
+
+    try:
+        async with httpx.AsyncClient(base_url=get_base_url(city), timeout=30) as client:
+            await asyncio.gather(*(probe(client, i * spacing) for i in range(probes)))
+    finally:
+        poller.cancel()
+
+    return summarize(latencies) | {'timeouts': timeouts}
+
+async def bench_reads(api: str, city: str, concurrency: int, duration: float) -> dict:
+    paths = [
+        f'/v1/cities/{city}/requests',
+        f'/v1/cities/{city}/requests?limit=50',
+        f'/v1/cities/{city}/requests?sort=-requested_datetime&limit=50&fields=lat,long,priority',
+        f'/v1/cities/{city}/quick_stats',
+        '/v1/stats',
+        '/v1/recents',
+    ]
+    latencies = {path: [] for path in paths}
+    errors = {path: 0 for path in paths}
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client: httpx.AsyncClient, offset: int):
+        i = offset
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, headers={'Accept-Encoding': 'gzip'})
+                response.raise_for_status()
+                latencies[path].append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors[path] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=api, timeout=30, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests_per_second': total / elapsed if elapsed else None,
+        'overall': summarize([v for values in latencies.values() for v in values]),
+        'endpoints': {path: summarize(latencies[path]) | {'errors': errors[path]} for path in paths}
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description='End-to-end ingest and read benchmark against the mock services')
+    parser.add_argument('city', help='a city pointed at mock_open311')
+    parser.add_argument('--count', type=int, default=10_000, help='synthetic requests to seed')
+    parser.add_argument('--days', type=float, default=1, help='spread seeded requests over this many days')
+    parser.add_argument('--open-ratio', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-seed', action='store_true', help='use whatever the mock already holds')
+    parser.add_argument('--probes', type=int, default=20, help='reports created to time visibility, 0 skips it')
+    parser.add_argument('--probe-spacing', type=float, default=0.5)
+    parser.add_argument('--api', help='API base url; the read benchmark is skipped without it')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--out', help='results file, defaults to bench-results/<timestamp>.json')
+    args = parser.parse_args()
+
+    if args.city not in settings.cities:
+        parser.error(f'Unknown city: {args.city}')
+
+    started = datetime.now(timezone.utc)
+    results = {
+        'commit': git_commit(),
+        'started_at': started.isoformat(timespec='seconds'),
+        'params': vars(args),
+        'settings': {
+            'models': settings.models,
+            'classify_workers': settings.classify_workers,
+            'classify_max_chunk': settings.classify_max_chunk,
+            'openai_max_in_flight': settings.openai_max_in_flight,
+            'pipeline_depth': settings.pipeline_depth,
+            'poll_interval': settings.poll_interval,
+            'poll_min_interval': settings.poll_min_interval,
+            'poll_max_interval': settings.poll_max_interval,
+            'poll_target_changes': settings.poll_target_changes,
+            'max_concurrent_fetches': settings.max_concurrent_fetches
+        }
+    }
+
+    try:
+        if not args.no_seed:
+            results['seed'] = await seed(args.city, args)
+            log.info('seeded %s', results['seed'])
+
+        await reset_city(args.city)
+        results['ingest'] = await bench_ingest(args.city)
+        log.info('ingest: %s', results['ingest'])
+
+        if args.probes:
+            results['visibility'] = await bench_visibility(args.city, args.probes, args.probe_spacing)
+            log.info('visibility: %s', results['visibility'])
+
+        if args.api:
+            results['reads'] = await bench_reads(args.api, args.city, args.concurrency, args.duration)
+            log.info('reads: %s', results['reads']['overall'])
+    finally:
+        await close_clients()
+        await archive.close()
+
+    out = Path(args.out or f'bench-results/{started.strftime("%Y%m%dT%H%M%S")}.json')
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    print(out)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -4,9 +4,67 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     openai_api_key: str = Field(..., env='OPENAI_API_KEY')
+    openai_base_url: str | None = Field(None, env='OPENAI_BASE_URL')
     #api_keys: str = Field(..., env='API_KEYS')
     redis_url: str = Field('redis://redis:6379/0', env='REDIS_URL')
     poll_interval: int = Field(10, env='POLL_INTERVAL')
+    poll_min_interval: float = Field(5, env='POLL_MIN_INTERVAL')
+    poll_max_interval: float = Field(300, env='POLL_MAX_INTERVAL')
+    poll_target_changes: float = Field(5, env='POLL_TARGET_CHANGES')
+    poll_ewma_alpha: float = Field(0.3, env='POLL_EWMA_ALPHA')
+    poll_max_backoff: float = Field(900, env='POLL_MAX_BACKOFF')
+    max_concurrent_fetches: int = Field(8, env='MAX_CONCURRENT_FETCHES')
+    fetch_max_tries: int = Field(3, env='FETCH_MAX_TRIES')
+    page_interval: float = Field(0, env='PAGE_INTERVAL')
+    pipeline_depth: int = Field(4, env='PIPELINE_DEPTH')
+    classify_workers: int = Field(4, env='CLASSIFY_WORKERS')
+    classify_queue_max: int = Field(5000, env='CLASSIFY_QUEUE_MAX')
+    classify_aging_rate: float = Field(0.02, env='CLASSIFY_AGING_RATE')
+    delta_polling: bool = Field(True, env='DELTA_POLLING')
+    delta_recheck_interval: int = Field(24 * 60 * 60, env='DELTA_RECHECK_INTERVAL')
+    full_sweep_interval: int = Field(900, env='FULL_SWEEP_INTERVAL')
+    reconcile_interval: int = Field(60, env='RECONCILE_INTERVAL')
+    reconcile_after: int = Field(3600, env='RECONCILE_AFTER')
+    reconcile_batch_size: int = Field(50, env='RECONCILE_BATCH_SIZE')
+    reconcile_budget: int = Field(10, env='RECONCILE_BUDGET')
+    lease_ttl: float = Field(30.0, env='LEASE_TTL')
+    metrics_port: int = Field(9100, env='METRICS_PORT')
+    dedup_enabled: bool = Field(True, env='DEDUP_ENABLED')
+    dedup_radius: float = Field(150, env='DEDUP_RADIUS')
+    dedup_window: int = Field(6 * 60 * 60, env='DEDUP_WINDOW')
+    dedup_similarity: float = Field(0.25, env='DEDUP_SIMILARITY')
+    dedup_max_candidates: int = Field(20, env='DEDUP_MAX_CANDIDATES')
+    archive_path: str = Field('archive/requests.db', env='ARCHIVE_PATH')
+    archive_batch_size: int = Field(500, env='ARCHIVE_BATCH_SIZE')
+    archive_flush_interval: float = Field(1.0, env='ARCHIVE_FLUSH_INTERVAL')
+    archive_queue_max: int = Field(1000, env='ARCHIVE_QUEUE_MAX')
+    archive_replay_on_start: bool = Field(True, env='ARCHIVE_REPLAY_ON_START')
+    classification_cache_ttl: int = Field(7 * 24 * 60 * 60, env='CLASSIFICATION_CACHE_TTL')
+    classification_cache_max: int = Field(100_000, env='CLASSIFICATION_CACHE_MAX')
+    openai_max_in_flight: int = Field(8, env='OPENAI_MAX_IN_FLIGHT')
+    openai_rpm: int = Field(500, env='OPENAI_RPM')
+    openai_tpm: int = Field(200_000, env='OPENAI_TPM')
+    classify_token_budget: int = Field(4000, env='CLASSIFY_TOKEN_BUDGET')
+    classify_max_chunk: int = Field(20, env='CLASSIFY_MAX_CHUNK')
+    classify_target_latency: float = Field(20.0, env='CLASSIFY_TARGET_LATENCY')
+    batch_dir: str = Field('batches', env='BATCH_DIR')
+    batch_poll_interval: int = Field(60, env='BATCH_POLL_INTERVAL')
+    response_cache_ttl: float = Field(5.0, env='RESPONSE_CACHE_TTL')
+    geo_cluster_zoom: int = Field(13, env='GEO_CLUSTER_ZOOM')
+    delta_stream_maxlen: int = Field(10_000, env='DELTA_STREAM_MAXLEN')
+    sse_queue_size: int = Field(1000, env='SSE_QUEUE_SIZE')
+    sse_heartbeat: float = Field(15.0, env='SSE_HEARTBEAT')
+    sse_retry_ms: int = Field(3000, env='SSE_RETRY_MS')
+    http_max_connections: int = Field(10, env='HTTP_MAX_CONNECTIONS')
+    http_max_keepalive: int = Field(5, env='HTTP_MAX_KEEPALIVE')
+    http_keepalive_expiry: float = Field(30.0, env='HTTP_KEEPALIVE_EXPIRY')
+    media_check: bool = Field(True, env='MEDIA_CHECK')
+    media_concurrency: int = Field(16, env='MEDIA_CONCURRENCY')
+    media_timeout: float = Field(5.0, env='MEDIA_TIMEOUT')
+    media_max_bytes: int = Field(20 * 1024 * 1024, env='MEDIA_MAX_BYTES')
+    media_cache_ttl: int = Field(24 * 60 * 60, env='MEDIA_CACHE_TTL')
+    media_inline: bool = Field(False, env='MEDIA_INLINE')
+    media_inline_max_px: int = Field(512, env='MEDIA_INLINE_MAX_PX')
     cities: dict[str, str] = Field(..., env='CITIES')
     models: list[str] = Field(..., env='')
 
@@ -1,14 +1,32 @@
 import asyncio
-from app.tasks.ingest import start_pollers
+from app.core.config import get_settings
+from app.tasks.ingest import run_pollers
+from app.services.georeport_client import close_clients
+from app.services.media import close_client as close_media_client
+from app.services.archive import archive
+from app.tasks.replay import replay_missing
+from app.utils.metrics import serve as serve_metrics
+import app.services.cache as cache
 
-async def main():
-    await start_pollers()
+settings = get_settings()
 
-    stop = asyncio.Event()
+async def main():
+    # metrics_port 0 turns the /metrics listener off
+    metrics_server = asyncio.create_task(serve_metrics(settings.metrics_port)) if settings.metrics_port else None
     try:
-        await stop.wait()  # sleeps until cancelled
+        await cache.ensure_rollups(list(settings.cities))
+        await cache.backfill_confirmed(list(settings.cities))
+        if archive.enabled and settings.archive_replay_on_start:
+            await replay_missing(list(settings.cities))
+        await run_pollers()  # runs until cancelled
     except asyncio.CancelledError:
         pass
+    finally:
+        if metrics_server:
+            metrics_server.cancel()
+        await close_clients()
+        await close_media_client()
+        await archive.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
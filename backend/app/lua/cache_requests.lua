@@ -0,0 +1,113 @@
+-- Writes a batch of classified requests and keeps the counters and indexes in step.
+-- KEYS: open set, priority sum, ts zset, priority zset, meta hash,
+--       global priority sum, global num open, global ts zset, global priority zset,
+--       city generation, global generation, delta stream, confirmed zset,
+--       city geo set, global geo set, city rollup, global rollup, then one req key per item
+-- ARGV: expiration, city, stream max length, city flag/label set prefixes,
+--       global flag/label set prefixes, duplicate set prefix,
+--       then (id, payload, fields, text, priority, ts, comma separated flags, label,
+--       longitude, latitude, duplicate_of) per item, coordinates empty when the request
+--       has none and duplicate_of empty unless it repeats an open request,
+--       where payload is the full JSON for the delta stream, fields a JSON object of
+--       JSON encoded hash values and text the compressed long fields (may be empty)
+-- rollup(), unregister() and the other helpers come from rollup.lua, prepended when the
+-- script is registered.
+-- Flag, label and duplicate set keys are built from the prefixes, so this assumes a single Redis node.
+local open_set, priority_sum, ts_zset, priority_zset, meta = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+local global_priority_sum, global_num_open, global_ts_zset, global_priority_zset = KEYS[6], KEYS[7], KEYS[8], KEYS[9]
+local generation, global_generation, stream, confirmed = KEYS[10], KEYS[11], KEYS[12], KEYS[13]
+local geo, global_geo, city_rollup, global_rollup = KEYS[14], KEYS[15], KEYS[16], KEYS[17]
+local expiration, city, stream_maxlen = tonumber(ARGV[1]), ARGV[2], ARGV[3]
+local flag_prefix, label_prefix = ARGV[4], ARGV[5]
+local global_flag_prefix, global_label_prefix = ARGV[6], ARGV[7]
+local dup_prefix = ARGV[8]
+local FIRST_KEY, FIRST_ARG, ARGS_PER_ITEM = 18, 9, 11
+local now = tonumber(redis.call('TIME')[1])
+local idx = request_indexes(4)
+
+for i = FIRST_KEY, #KEYS do
+    local key = KEYS[i]
+    local base = FIRST_ARG + (i - FIRST_KEY) * ARGS_PER_ITEM
+    local id, payload = ARGV[base], ARGV[base + 1]
+    local fields, text = cjson.decode(ARGV[base + 2]), ARGV[base + 3]
+    local priority, ts = tonumber(ARGV[base + 4]), tonumber(ARGV[base + 5])
+    local label = ARGV[base + 7]
+    local lon, lat = ARGV[base + 8], ARGV[base + 9]
+    local duplicate_of = ARGV[base + 10]
+    local flags = {}
+    for flag in string.gmatch(ARGV[base + 6], '[^,]+') do
+        table.insert(flags, flag)
+    end
+
+    -- re-caching an open request replaces its priority and tags instead of counting it twice
+    local delta = priority
+    local event = 'add'
+    if redis.call('SISMEMBER', open_set, id) == 1 then
+        event = 'update'
+        delta = priority - tonumber(unregister(idx, key, id).p)
+    else
+        redis.call('SADD', open_set, id)
+        redis.call('INCR', global_num_open)
+    end
+
+    -- replaced wholesale so fields that went null do not linger
+    local hash = {}
+    for name, value in pairs(fields) do
+        table.insert(hash, name)
+        table.insert(hash, value)
+    end
+    redis.call('DEL', key)
+    if #hash > 0 then
+        redis.call('HSET', key, unpack(hash))
+        redis.call('EXPIRE', key, expiration)
+    end
+    if text ~= '' then
+        redis.call('SET', key .. ':text', text, 'EX', expiration)
+    else
+        redis.call('DEL', key .. ':text')
+    end
+    local stored = {p = priority, t = ts, l = label, f = flags}
+    if duplicate_of ~= '' then
+        stored.d = duplicate_of
+        redis.call('SADD', dup_prefix .. duplicate_of, id)
+    end
+    redis.call('HSET', meta, id, cjson.encode(stored))
+    rollup(city_rollup, 1, stored)
+    rollup(global_rollup, 1, stored)
+    redis.call('ZADD', priority_zset, priority, id)
+    redis.call('ZADD', ts_zset, ts, id)
+    redis.call('ZADD', confirmed, now, id)
+    if lon ~= '' then
+        redis.call('GEOADD', geo, lon, lat, id)
+        redis.call('GEOADD', global_geo, lon, lat, key)
+    else
+        redis.call('ZREM', geo, id)
+        redis.call('ZREM', global_geo, key)
+    end
+    redis.call('INCRBY', priority_sum, delta)
+    for _, flag in ipairs(flags) do
+        redis.call('SADD', flag_prefix .. flag, id)
+        redis.call('SADD', global_flag_prefix .. flag, key)
+    end
+    if label ~= '' then
+        redis.call('SADD', label_prefix .. label, id)
+        redis.call('SADD', global_label_prefix .. label, key)
+    end
+
+    -- global updates
+    redis.call('INCRBY', global_priority_sum, delta)
+    redis.call('ZADD', global_ts_zset, ts, key)
+    redis.call('ZADD', global_priority_zset, priority, key)
+
+    -- live subscribers get the delta in the same atomic step
+    redis.call('XADD', stream, 'MAXLEN', '~', stream_maxlen, '*',
+        'type', event, 'city', city, 'id', id, 'payload', payload)
+end
+
+-- readers key their response caches on these
+if #KEYS >= FIRST_KEY then
+    redis.call('INCR', generation)
+    redis.call('INCR', global_generation)
+end
+
+return #KEYS - FIRST_KEY + 1
@@ -0,0 +1,23 @@
+-- Marks open requests as just seen open upstream and pushes back their expiry.
+-- KEYS: open set, confirmed zset, then one req key per item
+-- ARGV: expiration, then one id per item
+-- Returns 1 per confirmed item, 0 for ids that are not cached or whose payload already
+-- expired, so callers can pass every id they saw.
+local open_set, confirmed = KEYS[1], KEYS[2]
+local expiration = tonumber(ARGV[1])
+local FIRST_KEY, FIRST_ARG = 3, 2
+local now = tonumber(redis.call('TIME')[1])
+local result = {}
+
+for i = FIRST_KEY, #KEYS do
+    local key = KEYS[i]
+    local id = ARGV[FIRST_ARG + i - FIRST_KEY]
+    result[i - FIRST_KEY + 1] = 0
+    if redis.call('SISMEMBER', open_set, id) == 1 and redis.call('EXPIRE', key, expiration) == 1 then
+        redis.call('EXPIRE', key .. ':text', expiration)
+        redis.call('ZADD', confirmed, now, id)
+        result[i - FIRST_KEY + 1] = 1
+    end
+end
+
+return result
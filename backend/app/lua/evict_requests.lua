@@ -0,0 +1,45 @@
+-- Evicts a batch of requests, reading each stored priority and its tags server-side.
+-- Returns the ids that were open and are now evicted.
+-- KEYS: open set, priority sum, ts zset, priority zset, meta hash,
+--       global priority sum, global num open, global ts zset, global priority zset,
+--       city generation, global generation, delta stream, confirmed zset,
+--       city geo set, global geo set, city rollup, global rollup, then one req key per item
+-- ARGV: city, stream max length, city flag/label set prefixes, global flag/label set prefixes,
+--       duplicate set prefix, then one id per item
+-- unregister() and drop_indexes() come from rollup.lua, prepended when the script is registered.
+local open_set, priority_sum = KEYS[1], KEYS[2]
+local global_priority_sum, global_num_open = KEYS[6], KEYS[7]
+local generation, global_generation, stream = KEYS[10], KEYS[11], KEYS[12]
+local city, stream_maxlen = ARGV[1], ARGV[2]
+local dup_prefix = ARGV[7]
+local FIRST_KEY, FIRST_ARG = 18, 8
+local idx = request_indexes(3)
+local evicted = {}
+
+for i = FIRST_KEY, #KEYS do
+    local key = KEYS[i]
+    local id = ARGV[FIRST_ARG + i - FIRST_KEY]
+
+    -- only requests still counted as open contribute to the counters
+    if redis.call('SISMEMBER', open_set, id) == 1 then
+        local priority = tonumber(unregister(idx, key, id).p)
+        redis.call('SREM', open_set, id)
+        redis.call('DECRBY', priority_sum, priority)
+        redis.call('DECRBY', global_priority_sum, priority)
+        redis.call('DECR', global_num_open)
+        redis.call('XADD', stream, 'MAXLEN', '~', stream_maxlen, '*', 'type', 'evict', 'city', city, 'id', id)
+        table.insert(evicted, id)
+    end
+
+    -- its duplicates keep their duplicate_of link but the group itself goes
+    redis.call('DEL', key, key .. ':text', dup_prefix .. id)
+    drop_indexes(idx, key, id)
+end
+
+-- readers key their response caches on these
+if #evicted > 0 then
+    redis.call('INCR', generation)
+    redis.call('INCR', global_generation)
+end
+
+return evicted
@@ -0,0 +1,97 @@
+-- Walks a sorted index from a cursor and returns one page of members passing the filters.
+-- KEYS: sort zset (priority or ts), priority zset, then any number of filter sets
+-- ARGV: reverse (1/0), limit, min priority, max priority, cursor member, cursor score
+-- Returns {next cursor member, next cursor score, member...}; the cursor is empty on the last page.
+local sort_zset, priority_zset = KEYS[1], KEYS[2]
+local reverse = ARGV[1] == '1'
+local limit = tonumber(ARGV[2])
+local min_priority, max_priority = tonumber(ARGV[3]), tonumber(ARGV[4])
+local cursor_member, cursor_score = ARGV[5], ARGV[6]
+local by_priority = sort_zset == priority_zset
+local SCAN_BATCH, MAX_SCAN = 200, 20000
+
+-- resume right after the cursor; if it has been evicted, resume after its score
+local start = 0
+if cursor_member ~= '' then
+    local rank
+    if reverse then
+        rank = redis.call('ZREVRANK', sort_zset, cursor_member)
+    else
+        rank = redis.call('ZRANK', sort_zset, cursor_member)
+    end
+    if rank then
+        start = rank + 1
+    elseif reverse then
+        start = redis.call('ZCOUNT', sort_zset, cursor_score, '+inf')
+    else
+        start = redis.call('ZCOUNT', sort_zset, '-inf', cursor_score)
+    end
+elseif by_priority then
+    -- jump straight to the priority range
+    if reverse then
+        start = redis.call('ZCOUNT', sort_zset, '(' .. max_priority, '+inf')
+    else
+        start = redis.call('ZCOUNT', sort_zset, '-inf', '(' .. min_priority)
+    end
+end
+
+local page = {}
+local scanned = 0
+local last_member, last_score, last_rank = '', '', -1
+
+while #page < limit and scanned < MAX_SCAN do
+    local batch
+    if reverse then
+        batch = redis.call('ZREVRANGE', sort_zset, start, start + SCAN_BATCH - 1, 'WITHSCORES')
+    else
+        batch = redis.call('ZRANGE', sort_zset, start, start + SCAN_BATCH - 1, 'WITHSCORES')
+    end
+    if #batch == 0 then
+        return {'', '', unpack(page)}
+    end
+
+    for j = 1, #batch, 2 do
+        local member, score = batch[j], batch[j + 1]
+        local priority = by_priority and tonumber(score) or tonumber(redis.call('ZSCORE', priority_zset, member) or -1)
+        scanned = scanned + 1
+        last_member, last_score, last_rank = member, score, start + (j - 1) / 2
+
+        -- sorted by priority, nothing past the range can match
+        if by_priority and ((reverse and priority < min_priority) or (not reverse and priority > max_priority)) then
+            return {'', '', unpack(page)}
+        end
+
+        local match = priority >= min_priority and priority <= max_priority
+        for k = 3, #KEYS do
+            if match and redis.call('SISMEMBER', KEYS[k], member) == 0 then
+                match = false
+            end
+        end
+        if match then
+            table.insert(page, member)
+            if #page == limit then
+                break
+            end
+        end
+    end
+    start = start + SCAN_BATCH
+end
+
+-- the page is full (or the scan budget ran out); unless nothing that could still match
+-- follows, continue from the last member looked at
+local next_entry
+if reverse then
+    next_entry = redis.call('ZREVRANGE', sort_zset, last_rank + 1, last_rank + 1, 'WITHSCORES')
+else
+    next_entry = redis.call('ZRANGE', sort_zset, last_rank + 1, last_rank + 1, 'WITHSCORES')
+end
+if #next_entry == 0 then
+    return {'', '', unpack(page)}
+end
+if by_priority then
+    local priority = tonumber(next_entry[2])
+    if (reverse and priority < min_priority) or (not reverse and priority > max_priority) then
+        return {'', '', unpack(page)}
+    end
+end
+return {last_member, last_score, unpack(page)}
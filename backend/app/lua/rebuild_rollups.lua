@@ -0,0 +1,23 @@
+-- Recomputes every rollup from the meta hashes, for data written before rollups existed.
+-- KEYS: rollup version key, global rollup, then (meta hash, city rollup) per city
+-- ARGV: rollup version
+-- rollup() and bump() come from rollup.lua, prepended when the script is registered.
+-- One atomic pass, so writers never see or add to a half-built rollup.
+local version_key, global_rollup = KEYS[1], KEYS[2]
+
+redis.call('DEL', global_rollup)
+local total = 0
+for i = 3, #KEYS, 2 do
+    local meta, city_rollup = KEYS[i], KEYS[i + 1]
+    redis.call('DEL', city_rollup)
+    local entries = redis.call('HGETALL', meta)
+    for j = 2, #entries, 2 do
+        local item = cjson.decode(entries[j])
+        rollup(city_rollup, 1, item)
+        rollup(global_rollup, 1, item)
+        total = total + 1
+    end
+end
+
+redis.call('SET', version_key, ARGV[1])
+return total
@@ -0,0 +1,21 @@
+-- Extends or releases ingest leases, but only those still held by the caller.
+-- KEYS: one lease key per city
+-- ARGV: owner, ttl in milliseconds (0 releases instead of extending)
+-- Returns 1 or 0 per key, for held or lost.
+local owner, ttl = ARGV[1], tonumber(ARGV[2])
+local held = {}
+
+for i = 1, #KEYS do
+    if redis.call('GET', KEYS[i]) == owner then
+        if ttl > 0 then
+            redis.call('PEXPIRE', KEYS[i], ttl)
+        else
+            redis.call('DEL', KEYS[i])
+        end
+        held[i] = 1
+    else
+        held[i] = 0
+    end
+end
+
+return held
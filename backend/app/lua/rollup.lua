@@ -0,0 +1,99 @@
+-- Rollup and index helpers, prepended by cache.py to every script that writes rollups.
+-- Per dimension (everything, each label, each flag, each 5m/1h/1d bucket of request
+-- time) a count, a priority sum and a 10-wide priority histogram, all fields of one hash
+local ROLLUP_BUCKETS = {{'5m', 300}, {'1h', 3600}, {'1d', 86400}}
+
+local function bump(hash, field, by)
+    -- fields that fall back to zero are dropped so the hash only holds what is open
+    if redis.call('HINCRBY', hash, field, by) == 0 then
+        redis.call('HDEL', hash, field)
+    end
+end
+
+local function rollup(hash, sign, item)
+    local priority = tonumber(item.p) or 0
+    local dims = {'all'}
+    if item.l and item.l ~= '' then
+        table.insert(dims, 'label|' .. item.l)
+    end
+    for _, flag in ipairs(item.f or {}) do
+        table.insert(dims, 'flag|' .. flag)
+    end
+    local ts = tonumber(item.t)
+    if ts then
+        for _, bucket in ipairs(ROLLUP_BUCKETS) do
+            table.insert(dims, bucket[1] .. '|' .. (ts - ts % bucket[2]))
+        end
+    end
+    local histogram = 'h' .. math.min(math.floor(priority / 10), 9)
+    for _, dim in ipairs(dims) do
+        bump(hash, dim .. '|n', sign)
+        bump(hash, dim .. '|s', sign * priority)
+        bump(hash, dim .. '|' .. histogram, sign)
+    end
+end
+
+-- cache_requests and evict_requests share the first 17 KEYS (cache._counter_keys) and take
+-- the five flag/label/duplicate set prefixes from ARGV starting at prefix_arg
+local function request_indexes(prefix_arg)
+    return {
+        open_set = KEYS[1], priority_zset = KEYS[4], meta = KEYS[5], ts_zset = KEYS[3],
+        global_ts_zset = KEYS[8], global_priority_zset = KEYS[9], confirmed = KEYS[13],
+        geo = KEYS[14], global_geo = KEYS[15], city_rollup = KEYS[16], global_rollup = KEYS[17],
+        flag_prefix = ARGV[prefix_arg], label_prefix = ARGV[prefix_arg + 1],
+        global_flag_prefix = ARGV[prefix_arg + 2], global_label_prefix = ARGV[prefix_arg + 3],
+        dup_prefix = ARGV[prefix_arg + 4]
+    }
+end
+
+local function stored_priority(idx, key, id)
+    -- requests cached before the meta hash: the priority zset, else the payload itself
+    local priority = redis.call('ZSCORE', idx.priority_zset, id)
+    if priority then
+        return priority
+    end
+    local kind = redis.call('TYPE', key).ok
+    if kind == 'string' then
+        priority = cjson.decode(redis.call('GET', key)).priority
+    elseif kind == 'hash' then
+        priority = redis.call('HGET', key, 'priority')
+    end
+    return tonumber(priority) or 0
+end
+
+-- takes an open request out of the rollups and its flag, label and duplicate sets and returns
+-- what was stored for it; the caller settles the open set and priority sums
+local function unregister(idx, key, id)
+    local stored = redis.call('HGET', idx.meta, id)
+    if stored then
+        stored = cjson.decode(stored)
+        rollup(idx.city_rollup, -1, stored)
+        rollup(idx.global_rollup, -1, stored)
+    else
+        stored = {p = stored_priority(idx, key, id)}
+    end
+    for _, flag in ipairs(stored.f or {}) do
+        redis.call('SREM', idx.flag_prefix .. flag, id)
+        redis.call('SREM', idx.global_flag_prefix .. flag, key)
+    end
+    if stored.l and stored.l ~= '' then
+        redis.call('SREM', idx.label_prefix .. stored.l, id)
+        redis.call('SREM', idx.global_label_prefix .. stored.l, key)
+    end
+    if stored.d then
+        redis.call('SREM', idx.dup_prefix .. stored.d, id)
+    end
+    return stored
+end
+
+-- removes a request from the meta hash and every sorted and geo index
+local function drop_indexes(idx, key, id)
+    redis.call('HDEL', idx.meta, id)
+    redis.call('ZREM', idx.priority_zset, id)
+    redis.call('ZREM', idx.ts_zset, id)
+    redis.call('ZREM', idx.confirmed, id)
+    redis.call('ZREM', idx.geo, id)
+    redis.call('ZREM', idx.global_geo, key)
+    redis.call('ZREM', idx.global_ts_zset, key)
+    redis.call('ZREM', idx.global_priority_zset, key)
+end
@@ -1,8 +1,12 @@
-from fastapi import FastAPI, Depends
+import time
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import Response
 from app.core.config import get_settings
 from app.core.security import verify_api_key
 from app.routers.requests import router as requests_router
 from app.routers.stats import router as stats_router
+from app.utils.http_cache import send_cached
+from app.utils import metrics
 import app.services.cache as cache
 
 settings = get_settings()
@@ -15,6 +19,28 @@ app = FastAPI(
 app.include_router(requests_router)
 app.include_router(stats_router)
 
+@app.middleware('http')
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template so ids in paths don't explode the series count
+        route = request.scope.get('route')
+        metrics.HTTP_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route else 'unmatched',
+            status=status
+        )
+
+@app.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get('/ping')
 async def ping():
     return {'msg': 'pong'}
@@ -24,5 +50,11 @@ async def available_cities():
     return list(settings.cities.keys())
 
 @app.get('/v1/recents')
-async def get_recents(num: int = 15):
-    return await cache.get_recent_requests(num)
+async def get_recents(request: Request, num: int = 15, fields: str | None = None):
+    projection = [f for f in fields.split(',') if f] if fields else None
+    entry = await cache.cached_response(
+        f'recents:{num}:{fields}',
+        None,
+        lambda: cache.get_recent_requests(num, projection)
+    )
+    return send_cached(request, entry)
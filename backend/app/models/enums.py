@@ -8,3 +8,9 @@ class RequestFlag(str, Enum):
     SEVERITY_OVERSTATED = 'SEVERITY_OVERSTATED'
     INSUFFICIENT_INFO = 'INSUFFICIENT_INFO'
     INVALID_REPORT = 'INVALID_REPORT'
+
+class RequestSort(str, Enum):
+    PRIORITY_DESC = '-priority'
+    PRIORITY_ASC = 'priority'
+    NEWEST = '-requested_datetime'
+    OLDEST = 'requested_datetime'
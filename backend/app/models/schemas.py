@@ -1,6 +1,26 @@
-from pydantic import BaseModel, conint
+from pydantic import BaseModel, ConfigDict, conint, constr, field_validator
 from .enums import RequestFlag
 
+class Open311Request(BaseModel):
+    # only the fields the pipeline relies on are checked; everything else passes through
+    model_config = ConfigDict(extra='allow', coerce_numbers_to_str=True)
+
+    service_request_id: constr(min_length=1)
+    status: str | None = None
+    service_name: str | None = None
+    description: str | None = None
+    requested_datetime: str | None = None
+    updated_datetime: str | None = None
+    media_url: str | None = None
+    lat: float | None = None
+    long: float | None = None
+
+    @field_validator('lat', 'long', mode='before')
+    @classmethod
+    def _blank_coords(cls, value):
+        # some cities send "" for requests without a location
+        return None if isinstance(value, str) and not value.strip() else value
+
 class ClassifiedPayload(BaseModel):
     service_request_id: str
     priority: conint(ge=0, le=100)
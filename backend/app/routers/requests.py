@@ -1,5 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from app.core.config import get_settings
+from app.utils.http_cache import send_cached
+from app.models.enums import RequestFlag, RequestSort
+from app.services.broadcaster import event_stream, parse_event_id
 import app.services.cache as cache
 
 router = APIRouter(prefix='/v1/cities')
@@ -7,15 +11,147 @@ router = APIRouter(prefix='/v1/cities')
 settings = get_settings()
 
 @router.get('/{city}/requests')
-async def get_processed_requests(city: str):
-    if city == 'all':
-        return await cache.get_recent_requests(2000) # for all, return the 300 latest requests
+async def get_processed_requests(
+    city: str,
+    request: Request,
+    min_priority: int | None = Query(None, ge=0, le=100),
+    max_priority: int | None = Query(None, ge=0, le=100),
+    flag: list[RequestFlag] | None = Query(None),
+    label: str | None = None,
+    sort: RequestSort | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = None,
+    fields: str | None = None
+):
+    if city != 'all' and city not in settings.cities:
+        raise HTTPException(status_code=404, detail='City not found')
+
+    # comma separated projection, e.g. fields=lat,long,priority for a map layer
+    projection = [f for f in fields.split(',') if f] if fields else None
+
+    async def compute():
+        # no query parameters: keep returning the whole backlog for existing clients
+        params = (min_priority, max_priority, flag, label, sort, limit, cursor)
+        if all(param is None for param in params):
+            if city == 'all':
+                return await cache.get_recent_requests(2000, projection) # for all, return the 2000 latest requests
+            return await cache.mget_requests(city, projection)
+
+        try:
+            items, next_cursor = await cache.query_requests(
+                city,
+                min_priority=min_priority if min_priority is not None else 0,
+                max_priority=max_priority if max_priority is not None else 100,
+                flags=[f.value for f in flag or []],
+                label=label,
+                sort=sort or RequestSort.PRIORITY_DESC,
+                limit=limit or 50,
+                cursor=cursor,
+                fields=projection
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # the opaque cursor for the next page travels in a header so the body stays a plain list
+        return items, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+    name = f'requests:{city}:{sorted(request.query_params.multi_items())}'
+    return send_cached(request, await cache.cached_response(name, city, compute))
+
+def _parse_floats(value: str, count: int, name: str) -> list[float]:
+    try:
+        numbers = [float(v) for v in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise HTTPException(status_code=400, detail=f'{name} needs {count} comma separated numbers')
+    return numbers
+
+@router.get('/{city}/requests/geo')
+async def get_requests_in_view(
+    city: str,
+    request: Request,
+    bbox: str | None = Query(None, description='min_long,min_lat,max_long,max_lat'),
+    lat: float | None = Query(None, ge=-90, le=90),
+    long: float | None = Query(None, ge=-180, le=180),
+    radius: float | None = Query(None, gt=0, le=200_000, description='metres around lat/long'),
+    zoom: int | None = Query(None, ge=0, le=22),
+    limit: int = Query(500, ge=1, le=5000),
+    fields: str | None = None
+):
+    if city != 'all' and city not in settings.cities:
+        raise HTTPException(status_code=404, detail='City not found')
+
+    box = None
+    if bbox:
+        box = _parse_floats(bbox, 4, 'bbox')
+        in_range = all(-180 <= v <= 180 for v in box[::2]) and all(-90 <= v <= 90 for v in box[1::2])
+        if not in_range or box[0] > box[2] or box[1] > box[3]:
+            raise HTTPException(status_code=400, detail='bbox must be min_long,min_lat,max_long,max_lat')
+    elif lat is None or long is None or radius is None:
+        raise HTTPException(status_code=400, detail='Either bbox or lat, long and radius are required')
+
+    projection = [f for f in fields.split(',') if f] if fields else None
+
+    async def compute():
+        return await cache.query_geo(
+            city,
+            bbox=tuple(box) if box else None,
+            center=(long, lat) if not box else None,
+            radius=radius,
+            zoom=zoom,
+            limit=limit,
+            fields=projection
+        )
+
+    name = f'geo:{city}:{sorted(request.query_params.multi_items())}'
+    return send_cached(request, await cache.cached_response(name, city, compute))
+
+@router.get('/{city}/requests/{req_id}/duplicates')
+async def get_duplicate_group(city: str, req_id: str, request: Request, fields: str | None = None):
     if city not in settings.cities:
         raise HTTPException(status_code=404, detail='City not found')
-    return await cache.mget_requests(city)
+
+    projection = [f for f in fields.split(',') if f] if fields else None
+
+    async def compute():
+        # asking with a duplicate's id returns the group it belongs to
+        found = await cache.get_requests(city, [req_id], ['duplicate_of'])
+        if not found:
+            raise HTTPException(status_code=404, detail='Request not found')
+        canonical_id = str(found[0].get('duplicate_of') or req_id)
+        canonical = await cache.get_requests(city, [canonical_id], projection)
+        return {
+            'canonical_id': canonical_id,
+            'canonical': canonical[0] if canonical else None, # closed while its duplicates are still open
+            'duplicates': await cache.get_duplicates(city, canonical_id, projection)
+        }
+
+    name = f'duplicates:{city}:{req_id}:{fields}'
+    return send_cached(request, await cache.cached_response(name, city, compute))
 
 @router.get('/{city}/quick_stats')
-async def get_quick_stats(city: str):
+async def get_quick_stats(city: str, request: Request):
     if city not in settings.cities:
         raise HTTPException(status_code=404, detail='City not found')
-    return await cache.get_city_stats(city)
+    entry = await cache.cached_response(f'quick_stats:{city}', city, lambda: cache.get_city_stats(city))
+    return send_cached(request, entry)
+
+@router.get('/{city}/events')
+async def stream_events(city: str, request: Request, last_event_id: str | None = None):
+    if city != 'all' and city not in settings.cities:
+        raise HTTPException(status_code=404, detail='City not found')
+
+    # EventSource resends the header on reconnect; the query param covers a fresh page load
+    last_event_id = request.headers.get('last-event-id') or last_event_id
+    if last_event_id:
+        try:
+            parse_event_id(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Invalid last event id')
+
+    return StreamingResponse(
+        event_stream(city, last_event_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -1,8 +1,19 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
+from app.core.config import get_settings
+from app.utils.http_cache import send_cached
 import app.services.cache as cache
 
+settings = get_settings()
+
 router = APIRouter(prefix="/v1")
 
 @router.get("/stats")
-async def global_stats():
-    return await cache.get_global_stats()
\ No newline at end of file
+async def global_stats(request: Request):
+    return send_cached(request, await cache.cached_response('stats', None, cache.get_global_stats))
+
+@router.get("/stats/rollups")
+async def rollup_stats(request: Request, city: str | None = None):
+    if city is not None and city not in settings.cities:
+        raise HTTPException(status_code=404, detail='City not found')
+    entry = await cache.cached_response(f'rollups:{city}', city, lambda: cache.get_rollups(city))
+    return send_cached(request, entry)
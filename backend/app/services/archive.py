@@ -0,0 +1,168 @@
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator
+from app.core.config import get_settings
+from app.utils.time_helper import parse_time
+from app.utils.metrics import ARCHIVE_ROWS, ARCHIVE_ERRORS
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('archive')
+
+settings = get_settings()
+
+# append-only: every classification and eviction is a new row, so the latest row per request is
+# its current state and everything before it is history
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS requests (
+    seq INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    requested_at INTEGER,
+    label TEXT,
+    priority INTEGER,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS requests_city_time ON requests (city, requested_at);
+CREATE INDEX IF NOT EXISTS requests_city_label ON requests (city, label, requested_at);
+CREATE INDEX IF NOT EXISTS requests_city_id ON requests (city, id, seq);
+'''
+
+INSERT = '''
+INSERT INTO requests (city, id, event, recorded_at, requested_at, label, priority, payload)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# the newest row of each request, kept only if it was cached rather than evicted
+LATEST = '''
+SELECT payload FROM requests
+WHERE seq IN (SELECT MAX(seq) FROM requests WHERE city = ? GROUP BY id)
+AND event = 'cache'
+ORDER BY requested_at
+'''
+
+_CLOSE = object()
+
+def _requested_epoch(payload: dict) -> int | None:
+    try:
+        return int(parse_time(payload['requested_datetime']).timestamp())
+    except Exception:
+        return None
+
+class Archive:
+    # SQLite in WAL mode; callers only enqueue rows and a single flush task writes them in
+    # batched transactions on a worker thread, so Redis writes never wait on the disk.
+    # The file is local to the process, so it only covers the cities this replica has owned.
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.archive_queue_max)
+        self._task: asyncio.Task | None = None
+        self._db: sqlite3.Connection | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        # with WAL this survives a crashed process and only risks the last commits on power loss
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.executescript(SCHEMA)
+        return db
+
+    def _insert(self, rows: list[tuple]) -> None:
+        if self._db is None:
+            self._db = self._connect()
+        with self._db:
+            self._db.executemany(INSERT, rows)
+
+    async def _put(self, rows: list[tuple]) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+        await self._queue.put(rows) # only waits if the disk has fallen far behind
+
+    async def record(self, city: str, payloads: dict[str, dict]) -> None:
+        if not self.enabled or not payloads:
+            return
+        now = time.time()
+        await self._put([
+            (
+                city,
+                req_id,
+                'cache',
+                now,
+                _requested_epoch(payload),
+                payload.get('incident_label'),
+                payload.get('priority'),
+                json.dumps(payload, ensure_ascii=False)
+            )
+            for req_id, payload in payloads.items()
+        ])
+
+    async def record_evictions(self, city: str, req_ids: list[str]) -> None:
+        if not self.enabled or not req_ids:
+            return
+        now = time.time()
+        await self._put([(city, req_id, 'evict', now, None, None, None, None) for req_id in req_ids])
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is _CLOSE:
+                break
+            rows = list(item)
+
+            # gather whatever else arrives within the flush interval into the same transaction
+            deadline = loop.time() + settings.archive_flush_interval
+            while len(rows) < settings.archive_batch_size:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), max(deadline - loop.time(), 0))
+                except TimeoutError:
+                    break
+                if item is _CLOSE:
+                    closing = True
+                    break
+                rows += item
+
+            try:
+                await asyncio.to_thread(self._insert, rows)
+                for event in ('cache', 'evict'):
+                    ARCHIVE_ROWS.inc(sum(1 for row in rows if row[2] == event), event=event)
+            except Exception as e:
+                ARCHIVE_ERRORS.inc(len(rows))
+                log.info('could not archive %d rows: %s', len(rows), e)
+
+    async def close(self) -> None:
+        # writes out everything queued so far
+        if self._task is not None:
+            await self._queue.put(_CLOSE)
+            await self._task
+            self._task = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def latest(self, city: str, chunk_size: int = 1000) -> AsyncIterator[list[dict]]:
+        # current payloads of every request still open as far as the archive knows, in chunks
+        db = await asyncio.to_thread(self._connect)
+        try:
+            cursor = await asyncio.to_thread(db.execute, LATEST, (city,))
+            while rows := await asyncio.to_thread(cursor.fetchmany, chunk_size):
+                yield [json.loads(payload) for (payload,) in rows]
+        finally:
+            db.close()
+
+archive = Archive(settings.archive_path)
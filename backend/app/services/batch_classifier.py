@@ -0,0 +1,184 @@
+import sys
+import json
+import asyncio
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from app.core.config import get_settings
+from app.models.schemas import ClassifiedPayload, BatchClassifiedPayload
+from app.services.openai_client import (
+    client,
+    pack_chunks,
+    split_cached,
+    remember_classifications,
+    build_model_input
+)
+from app.services.media import check_media
+import app.services.cache as cache
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('batch-classifier')
+
+settings = get_settings()
+
+BATCH_ENDPOINT = '/v1/responses'
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+# model output fields, stripped from cached payloads before they are re-scored
+CLASSIFICATION_FIELDS = set(ClassifiedPayload.model_fields) - {'service_request_id'}
+
+def _strict(schema: dict) -> dict:
+    # strict structured outputs want every object closed and every property required
+    if isinstance(schema, dict):
+        schema = {k: _strict(v) for k, v in schema.items()}
+        if schema.get('type') == 'object' and 'properties' in schema:
+            schema['required'] = list(schema['properties'])
+            schema['additionalProperties'] = False
+    elif isinstance(schema, list):
+        schema = [_strict(v) for v in schema]
+    return schema
+
+TEXT_FORMAT = {
+    'type': 'json_schema',
+    'name': BatchClassifiedPayload.__name__,
+    'schema': _strict(BatchClassifiedPayload.model_json_schema()),
+    'strict': True
+}
+
+def _manifest_path(batch_id: str) -> Path:
+    return Path(settings.batch_dir) / f'{batch_id}.manifest.json'
+
+def strip_classification(payload: dict) -> dict:
+    return {k: v for k, v in payload.items() if k not in CLASSIFICATION_FIELDS and k != 'city'}
+
+async def submit_batch(city: str, requests: list[dict]) -> str | None:
+    hits, uncached, digests = await split_cached(requests)
+    if hits:
+        await _store(city, {str(r['service_request_id']): r for r in requests}, hits)
+    if not uncached:
+        log.info('%s: nothing to submit, all %d requests were cached', city, len(requests))
+        return None
+
+    images = await check_media([request.get('media_url') for request in uncached])
+
+    # one batch line per chunk so the system prompt is still shared within a call
+    chunks = {f'{city}-{i}': chunk for i, chunk in enumerate(pack_chunks(uncached))}
+    lines = [
+        json.dumps({
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': BATCH_ENDPOINT,
+            'body': {
+                'model': settings.models[0],
+                'input': build_model_input(chunk, images=images),
+                'text': {'format': TEXT_FORMAT}
+            }
+        }, ensure_ascii=False)
+        for custom_id, chunk in chunks.items()
+    ]
+
+    batch_dir = Path(settings.batch_dir)
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    input_path = batch_dir / f'{city}-{stamp}.jsonl'
+    input_path.write_text('\n'.join(lines), encoding='utf-8')
+
+    input_file = await client.files.create(
+        file=(input_path.name, input_path.read_bytes()),
+        purpose='batch'
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window='24h',
+        metadata={'city': city}
+    )
+
+    # the manifest lets collect_batch map results back even from another process
+    _manifest_path(batch.id).write_text(json.dumps({
+        'city': city,
+        'chunks': chunks,
+        'digests': digests
+    }, ensure_ascii=False), encoding='utf-8')
+
+    log.info('%s: submitted batch %s with %d requests in %d calls', city, batch.id, len(uncached), len(chunks))
+    return batch.id
+
+async def wait_for_batch(batch_id: str):
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        counts = batch.request_counts
+        log.info(
+            'batch %s is %s (%d/%d done)',
+            batch_id,
+            batch.status,
+            counts.completed if counts else 0,
+            counts.total if counts else 0
+        )
+        await asyncio.sleep(settings.batch_poll_interval)
+
+def _output_text(body: dict) -> str | None:
+    for item in body.get('output', []):
+        for part in item.get('content') or []:
+            if part.get('type') == 'output_text':
+                return part['text']
+    return None
+
+async def _store(city: str, requests_by_id: dict[str, dict], classified: list[ClassifiedPayload]) -> int:
+    payloads = {}
+    for c in classified:
+        req_id = str(c.service_request_id)
+        request = requests_by_id.get(req_id)
+        if request is None:
+            continue
+        payload = request | c.model_dump()
+        payload['city'] = city
+        payloads[req_id] = payload
+
+    await cache.cache_requests(city, payloads)
+    return len(payloads)
+
+async def collect_batch(batch_id: str) -> int:
+    manifest = json.loads(_manifest_path(batch_id).read_text(encoding='utf-8'))
+    city = manifest['city']
+    chunks = manifest['chunks']
+
+    batch = await wait_for_batch(batch_id)
+    if batch.status != 'completed' or not batch.output_file_id:
+        log.info('batch %s ended as %s without output', batch_id, batch.status)
+        return 0
+
+    stored = 0
+    failed = 0
+
+    # stream the output file line by line and write each call's results as it arrives
+    async with client.files.with_streaming_response.content(batch.output_file_id) as response:
+        async for line in response.iter_lines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            chunk = chunks.get(record.get('custom_id'))
+            result = record.get('response') or {}
+            text = _output_text(result.get('body') or {})
+
+            if chunk is None or result.get('status_code') != 200 or text is None:
+                failed += 1
+                continue
+
+            try:
+                classified = BatchClassifiedPayload.model_validate_json(text).requests
+            except Exception as e:
+                log.info('batch %s: could not parse %s: %s', batch_id, record.get('custom_id'), e)
+                failed += 1
+                continue
+
+            await remember_classifications(classified, manifest['digests'])
+            stored += await _store(city, {str(r['service_request_id']): r for r in chunk}, classified)
+
+    log.info('%s: batch %s stored %d classifications, %d calls failed', city, batch_id, stored, failed)
+    return stored
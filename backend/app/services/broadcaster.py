@@ -0,0 +1,136 @@
+import sys
+import json
+import asyncio
+import logging
+from typing import AsyncIterator
+from app.core.config import get_settings
+import app.services.cache as cache
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('broadcaster')
+
+settings = get_settings()
+
+READ_BLOCK_MS = 15_000
+READ_COUNT = 500
+
+def parse_event_id(event_id: str) -> tuple[int, int]:
+    ms, _, seq = event_id.partition('-')
+    return int(ms), int(seq or 0)
+
+def format_event(event_id: str, fields: dict) -> str:
+    # payloads are stored as JSON already, so they are spliced in rather than re-encoded
+    data = f'{{"city":{json.dumps(fields["city"])},"id":{json.dumps(fields["id"])}'
+    if 'payload' in fields:
+        data += f',"payload":{fields["payload"]}'
+    data += '}'
+    return f'id: {event_id}\nevent: {fields["type"]}\ndata: {data}\n\n'
+
+class Subscription:
+    def __init__(self, city: str):
+        self.city = city
+        self.queue = asyncio.Queue(maxsize=settings.sse_queue_size)
+        self.overflowed = False
+
+    def offer(self, event_id: str, fields: dict) -> None:
+        if self.city != 'all' and fields.get('city') != self.city:
+            return
+        try:
+            self.queue.put_nowait((event_id, fields))
+        except asyncio.QueueFull:
+            # too slow to keep up; the stream is closed and the client resumes from its last id
+            self.overflowed = True
+
+class Broadcaster:
+    # one reader of the delta stream per worker, fanned out to every connected client
+    def __init__(self):
+        self._subscriptions: set[Subscription] = set()
+        self._task = None
+
+    def subscribe(self, city: str) -> Subscription:
+        subscription = Subscription(city)
+        self._subscriptions.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    async def _run(self) -> None:
+        latest = await cache.redis.xrevrange(cache.delta_stream_key(), count=1)
+        last_id = latest[0][0] if latest else '0-0'
+
+        while self._subscriptions:
+            try:
+                response = await cache.redis.xread(
+                    {cache.delta_stream_key(): last_id},
+                    count=READ_COUNT,
+                    block=READ_BLOCK_MS
+                )
+            except Exception as e:
+                log.info('delta stream read failed: %s', e)
+                await asyncio.sleep(1)
+                continue
+
+            for _, entries in response or []:
+                for event_id, fields in entries:
+                    last_id = event_id
+                    for subscription in list(self._subscriptions):
+                        subscription.offer(event_id, fields)
+
+    async def replay(self, city: str, after_id: str) -> AsyncIterator[tuple[str, dict] | None]:
+        # yields None when after_id has already been trimmed from the stream
+        oldest = await cache.redis.xrange(cache.delta_stream_key(), count=1)
+        if oldest and parse_event_id(oldest[0][0]) > parse_event_id(after_id):
+            yield None
+            return
+
+        start = f'({after_id}'
+        while True:
+            entries = await cache.redis.xrange(cache.delta_stream_key(), min=start, count=READ_COUNT)
+            for event_id, fields in entries:
+                if city == 'all' or fields.get('city') == city:
+                    yield event_id, fields
+            if len(entries) < READ_COUNT:
+                return
+            start = f'({entries[-1][0]}'
+
+broadcaster = Broadcaster()
+
+async def event_stream(city: str, last_event_id: str | None) -> AsyncIterator[str]:
+    # subscribe before replaying so nothing published in between is lost
+    subscription = broadcaster.subscribe(city)
+    last_seen = parse_event_id(last_event_id) if last_event_id else None
+
+    try:
+        yield f'retry: {settings.sse_retry_ms}\n\n'
+
+        if last_event_id:
+            async for event in broadcaster.replay(city, last_event_id):
+                if event is None:
+                    # history is gone; the client has to refetch its snapshot
+                    yield 'event: reset\ndata: {}\n\n'
+                    break
+                event_id, fields = event
+                last_seen = parse_event_id(event_id)
+                yield format_event(event_id, fields)
+
+        while True:
+            if subscription.overflowed and subscription.queue.empty():
+                return
+            try:
+                event_id, fields = await asyncio.wait_for(subscription.queue.get(), settings.sse_heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+
+            if last_seen and parse_event_id(event_id) <= last_seen:
+                continue # already sent during replay
+            last_seen = parse_event_id(event_id)
+            yield format_event(event_id, fields)
+    finally:
+        broadcaster.unsubscribe(subscription)
@@ -1,20 +1,54 @@
 import json
 import time
+import gzip
+import zlib
+import base64
+import hashlib
+from collections import OrderedDict
 from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, NamedTuple
+import brotli
 import redis.asyncio as redis_client
 from app.core.config import get_settings
+from app.models.enums import RequestSort
+from app.utils.metrics import REDIS_SECONDS, EVICTIONS
+from app.utils.geo import valid_coords, bbox_search_box, cluster
+from app.services.archive import archive
 
 ONE_HOUR = 3600
+REQUEST_TTL = 24 * 60 * 60 # refreshed whenever a request is confirmed open, so only orphans expire
+RESPONSE_CACHE_SIZE = 512
+BROTLI_QUALITY = 5 # close to gzip's speed; 11, the default, takes seconds on the full backlog
+SCRIPT_BATCH_SIZE = 500 # items per script call, keeps each call short on the server
+ROLLUP_VERSION = '1' # bump when the rollup layout changes so it is rebuilt from the meta hashes
+ROLLUP_HISTOGRAM_SIZE = 10
+ROLLUP_BUCKETS = ('5m', '1h', '1d')
 settings = get_settings()
 
 redis = redis_client.from_url(
     settings.redis_url,
     decode_responses=True,
 )
+# request text is stored compressed, so request reads go through a client that leaves bytes alone
+redis_raw = redis_client.from_url(settings.redis_url)
+
+LUA_PATH = Path(__file__).parents[1] / 'lua'
+ROLLUP_LUA = (LUA_PATH / 'rollup.lua').read_text()
+cache_requests_script = redis.register_script(ROLLUP_LUA + (LUA_PATH / 'cache_requests.lua').read_text())
+evict_requests_script = redis.register_script(ROLLUP_LUA + (LUA_PATH / 'evict_requests.lua').read_text())
+query_requests_script = redis.register_script((LUA_PATH / 'query_requests.lua').read_text())
+renew_leases_script = redis.register_script((LUA_PATH / 'renew_leases.lua').read_text())
+rebuild_rollups_script = redis.register_script(ROLLUP_LUA + (LUA_PATH / 'rebuild_rollups.lua').read_text())
+confirm_requests_script = redis.register_script((LUA_PATH / 'confirm_requests.lua').read_text())
 
 def req_key(city: str, req_id: str) -> str:
     return f'req:{city}:{req_id}'
 
+def text_key(key: str) -> str:
+    # takes the request key, since the global indexes only hold those
+    return f'{key}:text'
+
 def open_set_key(city: str) -> str:
     return f'city:{city}:open_ids'
 
@@ -24,6 +58,48 @@ def priority_sum_key(city: str) -> str:
 def ts_zset_key(city: str) -> str:
     return f'city:{city}:ts_open'
 
+def priority_zset_key(city: str) -> str:
+    return f'city:{city}:priority'
+
+def confirmed_zset_key(city: str) -> str:
+    return f'city:{city}:confirmed'
+
+def geo_key(city: str) -> str:
+    return f'city:{city}:geo'
+
+def meta_key(city: str) -> str:
+    return f'city:{city}:meta'
+
+def flag_set_key(city: str, flag: str) -> str:
+    return f'city:{city}:flag:{flag}'
+
+def label_set_key(city: str, label: str) -> str:
+    return f'city:{city}:label:{label}'
+
+def duplicates_key(city: str, req_id: str) -> str:
+    return f'city:{city}:dups:{req_id}'
+
+def rollup_key(city: str) -> str:
+    return f'city:{city}:rollup'
+
+def generation_key(city: str) -> str:
+    return f'city:{city}:gen'
+
+def watermark_key(city: str) -> str:
+    return f'city:{city}:watermark'
+
+def delta_disabled_key(city: str) -> str:
+    return f'city:{city}:delta_disabled'
+
+def classification_key(digest: str) -> str:
+    return f'clf:{digest}'
+
+def classification_index_key() -> str:
+    return 'clf:index'
+
+def media_key(url: str) -> str:
+    return f'media:{hashlib.sha1(url.encode()).hexdigest()}'
+
 def global_priority_sum_key() -> str:
     return 'global:priority_sum'
 
@@ -33,55 +109,288 @@ def global_num_open_key() -> str:
 def global_ts_zset_key() -> str:
     return 'global:ts_open'
 
+def global_priority_zset_key() -> str:
+    return 'global:priority'
+
+def global_geo_key() -> str:
+    return 'global:geo'
+
+def global_rollup_key() -> str:
+    return 'global:rollup'
+
+def rollup_version_key() -> str:
+    return 'rollup:version'
+
+def global_generation_key() -> str:
+    return 'global:gen'
+
+def delta_stream_key() -> str:
+    return 'stream:deltas'
+
+def lease_key(city: str) -> str:
+    return f'lease:{city}'
+
+def workers_key() -> str:
+    return 'ingest:workers'
+
+def global_flag_set_key(flag: str) -> str:
+    return f'global:flag:{flag}'
+
+def global_label_set_key(label: str) -> str:
+    return f'global:label:{label}'
+
+def normalize_label(label: str | None) -> str:
+    return ' '.join(str(label or '').lower().split())
+
+def _counter_keys(city: str) -> list[str]:
+    return [
+        open_set_key(city),
+        priority_sum_key(city),
+        ts_zset_key(city),
+        priority_zset_key(city),
+        meta_key(city),
+        global_priority_sum_key(),
+        global_num_open_key(),
+        global_ts_zset_key(),
+        global_priority_zset_key(),
+        generation_key(city),
+        global_generation_key(),
+        delta_stream_key(),
+        confirmed_zset_key(city),
+        geo_key(city),
+        global_geo_key(),
+        rollup_key(city),
+        global_rollup_key(),
+    ]
+
+def _script_args(city: str) -> list:
+    # the scripts append the flag or label to the prefixes to get the index set key
+    return [
+        city,
+        settings.delta_stream_maxlen,
+        flag_set_key(city, ''),
+        label_set_key(city, ''),
+        global_flag_set_key(''),
+        global_label_set_key(''),
+        duplicates_key(city, ''),
+    ]
+
+# a request is a hash of its short fields, each JSON encoded, next to one compressed blob of its
+# long free text; list and map views can then read a few fields without touching the text
+TEXT_FIELDS = frozenset({
+    'description',
+    'status_notes',
+    'service_notice',
+    'priority_explanation',
+    'flag_explanation',
+})
+# preset zlib dictionaries, keyed by the version byte each blob starts with; field names and common
+# report vocabulary give short texts something to back-reference. Add a new version to change it.
+TEXT_ZDICTS = {
+    1: (
+        '{"description":"","status_notes":"","service_notice":"",'
+        '"priority_explanation":"","flag_explanation":""}'
+        ' The report describes a the and of in on at near street sidewalk road avenue corner'
+        ' intersection block lane driveway alley park lot building property residents traffic'
+        ' vehicle car parked abandoned blocking pothole streetlight light signal trash garbage'
+        ' litter dumping graffiti debris tree branch water leak flooding sign broken damaged'
+        ' missing hazard safety pedestrians public there is has been for days weeks please'
+        ' the image shows photo does not match description location category severity'
+        ' appears to be likely minor moderate urgent risk no clear evidence '
+    ).encode(),
+}
+TEXT_VERSION = max(TEXT_ZDICTS)
+
+def _encode_request(payload: dict) -> tuple[str, bytes]:
+    # nulls are not stored at all; readers get them back as missing keys
+    fields, text = {}, {}
+    for field, value in payload.items():
+        if value is None:
+            continue
+        if field in TEXT_FIELDS:
+            text[field] = value
+        else:
+            fields[field] = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    if not text:
+        return json.dumps(fields, ensure_ascii=False), b''
+    compressor = zlib.compressobj(9, zdict=TEXT_ZDICTS[TEXT_VERSION])
+    raw = json.dumps(text, ensure_ascii=False, separators=(',', ':')).encode()
+    return json.dumps(fields, ensure_ascii=False), bytes([TEXT_VERSION]) + compressor.compress(raw) + compressor.flush()
+
+def _decode_text(blob: bytes | None) -> dict:
+    if not blob:
+        return {}
+    decompressor = zlib.decompressobj(zdict=TEXT_ZDICTS[blob[0]])
+    return json.loads(decompressor.decompress(blob[1:]) + decompressor.flush())
+
+def _decode_fields(names, values) -> dict:
+    # values are JSON already, so one object is spliced together and parsed in a single pass
+    parts = [
+        f'{json.dumps(name.decode() if isinstance(name, bytes) else name)}:{value.decode()}'
+        for name, value in zip(names, values)
+        if value is not None
+    ]
+    return json.loads('{' + ','.join(parts) + '}')
+
+async def _load_requests(keys: list[str], fields: list[str] | None = None) -> list[dict]:
+    # fields projects the read: only those hash fields are fetched, and the text blob is
+    # skipped unless one of its fields is asked for. Missing or expired requests are dropped.
+    if not keys:
+        return []
+
+    hash_fields = None
+    read_text = True
+    if fields is not None:
+        hash_fields = ['service_request_id', *(f for f in fields if f not in TEXT_FIELDS and f != 'service_request_id')]
+        read_text = any(f in TEXT_FIELDS for f in fields)
+
+    pipe = redis_raw.pipeline(transaction=False)
+    for key in keys:
+        if hash_fields is None:
+            pipe.hgetall(key)
+        else:
+            pipe.hmget(key, hash_fields)
+        if read_text:
+            pipe.get(text_key(key))
+    with REDIS_SECONDS.time(op='load_requests'):
+        results = await pipe.execute(raise_on_error=False)
+
+    step = 2 if read_text else 1
+    items = []
+    legacy = {} # position in items -> key still in the pre-hash string format
+    for i in range(0, len(results), step):
+        stored = results[i]
+        if isinstance(stored, Exception):
+            # WRONGTYPE until it is re-cached; read back as the whole JSON payload below
+            legacy[len(items)] = keys[i // step]
+            items.append(None)
+            continue
+        if not stored:
+            continue
+        if hash_fields is None:
+            item = _decode_fields(stored.keys(), stored.values())
+        elif stored[0] is None:
+            continue
+        else:
+            item = _decode_fields(hash_fields, stored)
+
+        if read_text and not isinstance(results[i + 1], Exception):
+            text = _decode_text(results[i + 1])
+            if fields is not None:
+                text = {k: v for k, v in text.items() if k in fields}
+            item.update(text)
+        items.append(item)
+
+    if legacy:
+        for position, raw in zip(legacy, await redis_raw.mget(list(legacy.values()))):
+            if raw:
+                payload = json.loads(raw)
+                items[position] = payload if fields is None else {k: v for k, v in payload.items() if k in fields or k == 'service_request_id'}
+
+    return [item for item in items if item is not None]
+
+def _coords(payload: dict) -> tuple:
+    lon, lat = payload.get('long'), payload.get('lat')
+    return (float(lon), float(lat)) if valid_coords(lon, lat) else ('', '')
+
+def _requested_epoch(payload: dict) -> int:
+    try:
+        ts_str = payload.get('requested_datetime')
+        return int(datetime.fromisoformat(ts_str.replace('Z', '+00:00')).timestamp())
+    except Exception:
+        return int(time.time())
+
+async def cache_requests(
+    city: str,
+    payloads: dict[str, dict],
+    expiration: int = REQUEST_TTL,
+    archived: bool = True
+) -> None:
+    # archived=False is for payloads replayed from the archive, which already has them
+    items = list(payloads.items())
+
+    for i in range(0, len(items), SCRIPT_BATCH_SIZE):
+        batch = items[i : i + SCRIPT_BATCH_SIZE]
+
+        keys = _counter_keys(city)
+        args = [expiration, *_script_args(city)]
+        for req_id, payload in batch:
+            keys.append(req_key(city, req_id))
+            args += [
+                req_id,
+                json.dumps(payload),
+                *_encode_request(payload),
+                int(payload.get('priority', 0)),
+                _requested_epoch(payload),
+                ','.join(payload.get('flag') or []),
+                normalize_label(payload.get('incident_label')),
+                *_coords(payload),
+                str(payload.get('duplicate_of') or '')
+            ]
+
+        with REDIS_SECONDS.time(op='cache_requests'):
+            await cache_requests_script(keys=keys, args=args)
+
+    if archived:
+        await archive.record(city, payloads)
+
 async def cache_request(
     city: str,
     req_id: str,
     payload: dict,
-    expiration: int = 24 * 60 * 60
+    expiration: int = REQUEST_TTL
 ) -> None:
-    priority = int(payload.get('priority', 0))
-    try:
-        ts_str = payload.get('requested_datetime')
-        ts_epoch = int(datetime.fromisoformat(ts_str.replace('Z', '+00:00')).timestamp())
-    except Exception:
-        ts_epoch = int(time.time())
+    await cache_requests(city, {req_id: payload}, expiration)
 
-    pipe = redis.pipeline(transaction=False)
+async def evict_requests(city: str, req_ids: list[str]) -> int:
+    req_ids = list(req_ids)
+    evicted = []
 
-    pipe.set(req_key(city, req_id), json.dumps(payload), ex=expiration)
-    pipe.sadd(open_set_key(city), req_id)
-    pipe.incrby(priority_sum_key(city), priority)
-    pipe.zadd(ts_zset_key(city), {req_id: ts_epoch})
+    for i in range(0, len(req_ids), SCRIPT_BATCH_SIZE):
+        batch = req_ids[i : i + SCRIPT_BATCH_SIZE]
+        keys = _counter_keys(city) + [req_key(city, req_id) for req_id in batch]
+        with REDIS_SECONDS.time(op='evict_requests'):
+            evicted += await evict_requests_script(keys=keys, args=_script_args(city) + batch)
 
-    # global updates
-    pipe.incrby(global_priority_sum_key(), priority)
-    pipe.incr(global_num_open_key())
-    pipe.zadd(global_ts_zset_key(), {req_key(city, req_id): ts_epoch})
-
-    await pipe.execute()
+    # ids that were not open have no cache row of their own to close in the archive
+    await archive.record_evictions(city, evicted)
+    EVICTIONS.inc(len(evicted), city=city)
+    return len(evicted)
 
 async def evict_request(city: str, req_id: str) -> None:
-    request_data = await redis.get(req_key(city, req_id))
-    priority = 0
-    if request_data:
-        try:
-            priority = int(json.loads(request_data).get('priority', 0))
-        except Exception:
-            pass
-
-    pipe = redis.pipeline(transaction=False)
-
-    pipe.delete(req_key(city, req_id))
-    pipe.srem(open_set_key(city), req_id)
-    pipe.decrby(priority_sum_key(city), priority)
-    pipe.zrem(ts_zset_key(city), req_id)
-
-    # global updates
-    pipe.decrby(global_priority_sum_key(), priority)
-    pipe.decr(global_num_open_key())
-    pipe.zrem(global_ts_zset_key(), req_key(city, req_id))
-
-    await pipe.execute()
+    await evict_requests(city, [req_id])
+
+async def confirm_requests(city: str, req_ids: list[str], expiration: int = REQUEST_TTL) -> list[str]:
+    # returns the ids that were cached and are now confirmed
+    req_ids = list(req_ids)
+    confirmed = []
+
+    for i in range(0, len(req_ids), SCRIPT_BATCH_SIZE):
+        batch = req_ids[i : i + SCRIPT_BATCH_SIZE]
+        keys = [open_set_key(city), confirmed_zset_key(city)] + [req_key(city, req_id) for req_id in batch]
+        with REDIS_SECONDS.time(op='confirm_requests'):
+            result = await confirm_requests_script(keys=keys, args=[expiration, *batch])
+        confirmed += [req_id for req_id, ok in zip(batch, result) if ok]
+
+    return confirmed
+
+async def backfill_confirmed(cities: list[str], batch_size: int = 1000) -> None:
+    # open ids cached before the confirmed zset existed are added at score 0, so reconcile
+    # looks at them first; NX leaves every id that has already been confirmed alone
+    for city in cities:
+        batch = []
+        async for req_id in redis.sscan_iter(open_set_key(city), count=batch_size):
+            batch.append(req_id)
+            if len(batch) >= batch_size:
+                await redis.zadd(confirmed_zset_key(city), dict.fromkeys(batch, 0), nx=True)
+                batch = []
+        if batch:
+            await redis.zadd(confirmed_zset_key(city), dict.fromkeys(batch, 0), nx=True)
+
+async def get_unconfirmed(city: str, before: float, limit: int) -> list[str]:
+    # open ids not seen upstream since `before`, longest unconfirmed first
+    return await redis.zrangebyscore(confirmed_zset_key(city), '-inf', f'({before}', start=0, num=limit)
 
 async def get_cached_ids(city: str) -> set[str]:
     return await redis.smembers(open_set_key(city))
@@ -91,22 +400,243 @@ async def is_cached(city: str, req_id: str) -> bool:
         return True
     return await redis.exists(req_key(city, req_id)) == 1
 
+async def filter_uncached(city: str, req_ids: list[str]) -> list[str]:
+    if not req_ids:
+        return []
+
+    # one round trip for the whole page instead of SISMEMBER + EXISTS per id
+    pipe = redis.pipeline(transaction=False)
+    pipe.smismember(open_set_key(city), req_ids)
+    for req_id in req_ids:
+        pipe.exists(req_key(city, req_id))
+
+    with REDIS_SECONDS.time(op='filter_uncached'):
+        members, *exists = await pipe.execute()
+
+    return [
+        req_id for req_id, member, exist in zip(req_ids, members, exists)
+        if not member and not exist
+    ]
+
+async def get_classifications(digests: list[str]) -> list[dict | None]:
+    if not digests:
+        return []
+    raw = await redis.mget([classification_key(digest) for digest in digests])
+    return [json.loads(item) if item else None for item in raw]
+
+async def cache_classifications(classifications: dict[str, dict]) -> None:
+    if not classifications:
+        return
+
+    now = int(time.time())
+    pipe = redis.pipeline(transaction=False)
+    for digest, classification in classifications.items():
+        pipe.set(classification_key(digest), json.dumps(classification), ex=settings.classification_cache_ttl)
+    pipe.zadd(classification_index_key(), {digest: now for digest in classifications})
+    # drop index entries whose keys have already expired
+    pipe.zremrangebyscore(classification_index_key(), '-inf', now - settings.classification_cache_ttl)
+    pipe.zcard(classification_index_key())
+    *_, size = await pipe.execute()
+
+    # size bound: evict the oldest entries
+    overflow = size - settings.classification_cache_max
+    if overflow > 0:
+        oldest = await redis.zpopmin(classification_index_key(), overflow)
+        await redis.delete(*(classification_key(digest) for digest, _ in oldest))
+
+async def get_media_checks(urls: list[str]) -> list[dict | None]:
+    if not urls:
+        return []
+    raw = await redis.mget([media_key(url) for url in urls])
+    return [json.loads(item) if item else None for item in raw]
+
+async def cache_media_checks(checks: dict[str, dict]) -> None:
+    if not checks:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for url, check in checks.items():
+        # failures may be transient, so they are retried sooner
+        ttl = settings.media_cache_ttl if check['ok'] else ONE_HOUR
+        pipe.set(media_key(url), json.dumps(check), ex=ttl)
+    await pipe.execute()
+
+async def get_watermark(city: str) -> datetime | None:
+    value = await redis.get(watermark_key(city))
+    return datetime.fromtimestamp(int(value), timezone.utc) if value else None
+
+async def set_watermark(city: str, watermark: datetime) -> None:
+    await redis.set(watermark_key(city), int(watermark.timestamp()))
+
+async def disable_delta(city: str, ttl: int) -> None:
+    # shared by every replica, and lifted after ttl so a fixed endpoint gets deltas back
+    await redis.set(delta_disabled_key(city), 1, ex=ttl)
+
+async def is_delta_disabled(city: str) -> bool:
+    return await redis.exists(delta_disabled_key(city)) == 1
+
+async def heartbeat_worker(worker_id: str, ttl_ms: int) -> list[str]:
+    # registers the worker and returns every worker seen within the lease ttl
+    now = int(time.time() * 1000)
+    pipe = redis.pipeline(transaction=False)
+    pipe.zadd(workers_key(), {worker_id: now})
+    pipe.zremrangebyscore(workers_key(), '-inf', now - ttl_ms)
+    pipe.zrange(workers_key(), 0, -1)
+    *_, workers = await pipe.execute()
+    return workers
+
+async def remove_worker(worker_id: str) -> None:
+    await redis.zrem(workers_key(), worker_id)
+
+async def acquire_lease(city: str, worker_id: str, ttl_ms: int) -> bool:
+    return bool(await redis.set(lease_key(city), worker_id, nx=True, px=ttl_ms))
+
+async def renew_leases(cities: list[str], worker_id: str, ttl_ms: int) -> list[bool]:
+    if not cities:
+        return []
+    held = await renew_leases_script(keys=[lease_key(city) for city in cities], args=[worker_id, ttl_ms])
+    return [bool(h) for h in held]
+
+async def release_leases(cities: list[str], worker_id: str) -> None:
+    if cities:
+        await renew_leases_script(keys=[lease_key(city) for city in cities], args=[worker_id, 0])
+
 async def get_request(city: str, req_id: str) -> dict | None:
-    data = await redis.get(req_key(city, req_id))
-    return json.loads(data) if data else None
+    items = await _load_requests([req_key(city, req_id)])
+    return items[0] if items else None
+
+async def get_requests(city: str, req_ids: list[str], fields: list[str] | None = None) -> list[dict]:
+    return await _load_requests([req_key(city, req_id) for req_id in req_ids], fields)
+
+async def get_duplicates(city: str, req_id: str, fields: list[str] | None = None) -> list[dict]:
+    return await get_requests(city, list(await redis.smembers(duplicates_key(city, req_id))), fields)
 
-async def mget_requests(city: str) -> list[dict]:
+async def find_nearby(city: str, points: list[tuple[float, float]], radius: float, limit: int) -> list[list[str]]:
+    # ids of the open requests within radius metres of each (lon, lat), nearest first
+    if not points:
+        return []
+    pipe = redis.pipeline(transaction=False)
+    for lon, lat in points:
+        pipe.geosearch(geo_key(city), longitude=lon, latitude=lat, radius=radius, unit='m', sort='ASC', count=limit)
+    with REDIS_SECONDS.time(op='find_nearby'):
+        return await pipe.execute()
+
+async def mget_requests(city: str, fields: list[str] | None = None) -> list[dict]:
     req_ids = await redis.smembers(open_set_key(city))
     if not req_ids:
         return []
     
     keys = [req_key(city, req_id) for req_id in req_ids]
 
-    raw_reqs = await redis.mget(keys)
+    return await _load_requests(keys, fields)
 
-    items = [json.loads(req) for req in raw_reqs if req]
+def encode_cursor(member: str, score: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([member, score]).encode()).decode()
 
-    return items
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        member, score = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(member), str(score)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+async def query_requests(
+    city: str,
+    *,
+    min_priority: int = 0,
+    max_priority: int = 100,
+    flags: list[str] | None = None,
+    label: str | None = None,
+    sort: RequestSort = RequestSort.PRIORITY_DESC,
+    limit: int = 50,
+    cursor: str | None = None,
+    fields: list[str] | None = None
+) -> tuple[list[dict], str | None]:
+    # city == 'all' walks the global indexes, whose members are full request keys
+    by_priority = sort in (RequestSort.PRIORITY_DESC, RequestSort.PRIORITY_ASC)
+    if city == 'all':
+        priority_zset = global_priority_zset_key()
+        sort_zset = priority_zset if by_priority else global_ts_zset_key()
+        filter_sets = [global_flag_set_key(flag) for flag in flags or []]
+        if label:
+            filter_sets.append(global_label_set_key(normalize_label(label)))
+    else:
+        priority_zset = priority_zset_key(city)
+        sort_zset = priority_zset if by_priority else ts_zset_key(city)
+        filter_sets = [flag_set_key(city, flag) for flag in flags or []]
+        if label:
+            filter_sets.append(label_set_key(city, normalize_label(label)))
+
+    cursor_member, cursor_score = decode_cursor(cursor) if cursor else ('', '')
+    reverse = sort in (RequestSort.PRIORITY_DESC, RequestSort.NEWEST)
+
+    with REDIS_SECONDS.time(op='query_requests'):
+        next_member, next_score, *members = await query_requests_script(
+            keys=[sort_zset, priority_zset, *filter_sets],
+            args=[int(reverse), limit, min_priority, max_priority, cursor_member, cursor_score]
+        )
+    next_cursor = encode_cursor(next_member, next_score) if next_member else None
+
+    if not members:
+        return [], next_cursor
+
+    keys = members if city == 'all' else [req_key(city, req_id) for req_id in members]
+    return await _load_requests(keys, fields), next_cursor
+
+async def query_geo(
+    city: str,
+    *,
+    bbox: tuple[float, float, float, float] | None = None,
+    center: tuple[float, float] | None = None,
+    radius: float | None = None,
+    zoom: int | None = None,
+    limit: int = 500,
+    fields: list[str] | None = None
+) -> dict:
+    # bbox is (min_lon, min_lat, max_lon, max_lat), center is (lon, lat) with radius in metres.
+    # Below settings.geo_cluster_zoom every match in view is bucketed into grid clusters;
+    # above it the `limit` matches nearest the center are returned as requests.
+    key = global_geo_key() if city == 'all' else geo_key(city)
+    clustering = zoom is not None and zoom < settings.geo_cluster_zoom
+
+    if bbox:
+        lon, lat, width, height = bbox_search_box(*bbox)
+        search = {'longitude': lon, 'latitude': lat, 'width': width, 'height': height}
+    else:
+        lon, lat = center
+        search = {'longitude': lon, 'latitude': lat, 'radius': radius}
+
+    with REDIS_SECONDS.time(op='query_geo'):
+        matches = await redis.geosearch(
+            key,
+            **search,
+            unit='m',
+            sort='ASC',
+            withcoord=True
+        )
+
+    if bbox:
+        # the box is widened to cover the bbox, so trim what falls outside it
+        min_lon, min_lat, max_lon, max_lat = bbox
+        matches = [
+            (member, coords) for member, coords in matches
+            if min_lon <= coords[0] <= max_lon and min_lat <= coords[1] <= max_lat
+        ]
+    total = len(matches)
+
+    if not clustering:
+        members = [member for member, _ in matches[:limit]]
+        keys = members if city == 'all' else [req_key(city, req_id) for req_id in members]
+        return {'total': total, 'clusters': [], 'requests': await _load_requests(keys, fields)}
+
+    members = [member for member, _ in matches]
+    priority_zset = global_priority_zset_key() if city == 'all' else priority_zset_key(city)
+    priorities = await redis.zmscore(priority_zset, members) if members else []
+    points = [
+        # global members are request keys; clusters report the bare id
+        (member.split(':', 2)[2] if city == 'all' else member, coords[0], coords[1], int(priority or 0))
+        for (member, coords), priority in zip(matches, priorities)
+    ]
+    return {'total': total, 'clusters': cluster(points, zoom), 'requests': []}
 
 async def get_city_stats(city: str) -> dict:
     now = int(datetime.now(timezone.utc).timestamp())
@@ -156,9 +686,105 @@ async def get_global_stats() -> dict:
         'recent_requests': recent_requests
     }
 
-async def get_recent_requests(num: int) -> list[dict]:
+async def ensure_rollups(cities: list[str]) -> None:
+    # requests cached before rollups existed are only in the meta hashes; count them in once
+    if await redis.get(rollup_version_key()) == ROLLUP_VERSION:
+        return
+    keys = [rollup_version_key(), global_rollup_key()]
+    for city in cities:
+        keys += [meta_key(city), rollup_key(city)]
+    with REDIS_SECONDS.time(op='rebuild_rollups'):
+        await rebuild_rollups_script(keys=keys, args=[ROLLUP_VERSION])
+
+def _parse_rollup(raw: dict[str, str]) -> dict:
+    # fields are '{dimension}|{n, s or h0-h9}', dimensions 'all', 'label|..', 'flag|..' or '5m|{start}'
+    dims = {}
+    for field, value in raw.items():
+        dim, metric = field.rsplit('|', 1)
+        entry = dims.setdefault(dim, {'count': 0, 'sum': 0, 'histogram': [0] * ROLLUP_HISTOGRAM_SIZE})
+        if metric == 'n':
+            entry['count'] = int(value)
+        elif metric == 's':
+            entry['sum'] = int(value)
+        else:
+            entry['histogram'][int(metric[1:])] = int(value)
+
+    def summary(entry: dict) -> dict:
+        return {
+            'count': entry['count'],
+            'avg_priority': round(entry['sum'] / entry['count'], 1) if entry['count'] else 0.0,
+            'histogram': entry['histogram']
+        }
+
+    result = {
+        'total': summary(dims.pop('all', {'count': 0, 'sum': 0, 'histogram': [0] * ROLLUP_HISTOGRAM_SIZE})),
+        'labels': {},
+        'flags': {},
+        'buckets': {bucket: [] for bucket in ROLLUP_BUCKETS}
+    }
+    for dim, entry in dims.items():
+        kind, name = dim.split('|', 1)
+        if kind == 'label':
+            result['labels'][name] = summary(entry)
+        elif kind == 'flag':
+            result['flags'][name] = summary(entry)
+        elif kind in result['buckets']:
+            result['buckets'][kind].append({'start': int(name), **summary(entry)})
+    for buckets in result['buckets'].values():
+        buckets.sort(key=lambda b: b['start'])
+    return result
+
+async def get_rollups(city: str | None = None) -> dict:
+    # open requests broken down by label, flag and request time; histogram[i] counts
+    # priorities in [10i, 10i + 10), with 100 in the last bucket
+    return _parse_rollup(await redis.hgetall(rollup_key(city) if city else global_rollup_key()))
+
+async def get_recent_requests(num: int, fields: list[str] | None = None) -> list[dict]:
     keys = await redis.zrevrange(global_ts_zset_key(), 0, num - 1)
-    if not keys:
-        return []
-    raw = await redis.mget(keys)
-    return [json.loads(item) for item in raw if item]
\ No newline at end of file
+    return await _load_requests(keys, fields)
+
+class CachedResponse(NamedTuple):
+    generation: str
+    expires: float
+    etag: str
+    body: bytes
+    gzip_body: bytes
+    br_body: bytes
+    headers: dict[str, str]
+
+# ready-to-send response bodies, valid until the writer bumps the generation or max_age passes
+_responses: OrderedDict[str, CachedResponse] = OrderedDict()
+
+async def cached_response(
+    name: str,
+    city: str | None,
+    compute: Callable[[], Awaitable[Any]],
+    max_age: float | None = None
+) -> CachedResponse:
+    # compute may return (data, headers) to have extra headers cached with the body
+    generation = await redis.get(generation_key(city) if city and city != 'all' else global_generation_key()) or '0'
+    now = time.monotonic()
+
+    entry = _responses.get(name)
+    if entry and entry.generation == generation and entry.expires > now:
+        _responses.move_to_end(name)
+        return entry
+
+    result = await compute()
+    data, headers = result if isinstance(result, tuple) else (result, {})
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+    entry = CachedResponse(
+        generation=generation,
+        expires=now + (max_age if max_age is not None else settings.response_cache_ttl),
+        etag=f'W/"{hashlib.sha1(body).hexdigest()[:20]}"',
+        body=body,
+        gzip_body=gzip.compress(body, compresslevel=6),
+        br_body=brotli.compress(body, quality=BROTLI_QUALITY),
+        headers=headers
+    )
+    _responses[name] = entry
+    _responses.move_to_end(name)
+    while len(_responses) > RESPONSE_CACHE_SIZE:
+        _responses.popitem(last=False)
+    return entry
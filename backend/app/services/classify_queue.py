@@ -0,0 +1,147 @@
+import sys
+import time
+import heapq
+import asyncio
+import logging
+from itertools import count
+from app.core.config import get_settings
+from app.services.openai_client import classify_batch_in_chunks, pack_chunks
+from app.utils.time_helper import parse_time
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('classify-queue')
+
+settings = get_settings()
+
+# cheap local hints of severity; the model still makes the final call
+SERVICE_SCORES = {
+    'traffic signal': 60,
+    'streetlight': 35,
+    'pothole': 30,
+    'abandoned vehicle': 20,
+    'broken sidewalk': 20,
+    'illegal dumping': 15,
+    'missed pickup': 10,
+    'litter': 5,
+    'graffiti': 5,
+}
+KEYWORD_SCORES = {
+    'gas leak': 100,
+    'smell of gas': 100,
+    'fire': 80,
+    'smoke': 60,
+    'downed wire': 90,
+    'power line': 80,
+    'sinkhole': 70,
+    'flood': 60,
+    'water main': 60,
+    'injur': 60,
+    'blocking': 30,
+    'hazard': 30,
+    'danger': 30,
+    'urgent': 20,
+}
+RECENCY_BONUS = 20 # full bonus for brand new reports, fading out over a day
+
+def prescore(request: dict) -> float:
+    service_name = str(request.get('service_name') or '').lower()
+    text = f"{service_name} {request.get('description') or ''}".lower()
+
+    score = max((v for k, v in SERVICE_SCORES.items() if k in service_name), default=0)
+    score = max(score, max((v for k, v in KEYWORD_SCORES.items() if k in text), default=0))
+
+    try:
+        age = time.time() - parse_time(request['requested_datetime']).timestamp()
+        score += RECENCY_BONUS * max(0.0, 1 - age / 86400)
+    except Exception:
+        pass
+
+    return score
+
+class ClassificationQueue:
+    # items wait in per-city heaps ordered by prescore plus aging; each worker takes the
+    # best-scoring city and packs a chunk from the top of its heap
+    def __init__(self, workers: int, max_items: int):
+        self._heaps: dict[str, list] = {}
+        self._seq = count()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Semaphore(max_items)
+        self._size = 0
+        self._workers = workers
+        self._tasks = []
+
+    def _start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+
+    async def submit(self, city: str, requests: list[dict], sink: asyncio.Queue) -> None:
+        # results arrive on sink as (requests, classifications) or (requests, exception)
+        self._start()
+        heap = self._heaps.setdefault(city, [])
+        for request in requests:
+            await self._space.acquire() # backpressure once the queue is full
+            # effective score = prescore + classify_aging_rate * waited, which orders the same
+            # as prescore - classify_aging_rate * enqueued_at, so the heap never needs rekeying
+            key = settings.classify_aging_rate * time.monotonic() - prescore(request)
+            heapq.heappush(heap, (key, next(self._seq), request, sink))
+            self._size += 1
+            self._ready.set()
+
+    def _take_chunk(self) -> tuple[str, list]:
+        city = min((c for c, heap in self._heaps.items() if heap), key=lambda c: self._heaps[c][0])
+        heap = self._heaps[city]
+
+        # no chunk is longer than classify_max_chunk, so that many from the top are enough to
+        # pack the first one; the rest go back with their original keys
+        top = [heapq.heappop(heap) for _ in range(min(len(heap), settings.classify_max_chunk))]
+        chunk = top[:len(pack_chunks([item[2] for item in top])[0])]
+        for item in top[len(chunk):]:
+            heapq.heappush(heap, item)
+
+        self._release(len(chunk))
+        return city, chunk
+
+    def _release(self, taken: int) -> None:
+        self._size -= taken
+        for _ in range(taken):
+            self._space.release()
+        if not self._size:
+            self._ready.clear()
+
+    def discard(self, sink: asyncio.Queue) -> None:
+        # drops whatever a pipeline that failed or was cancelled still has waiting; heaps are
+        # filtered in place since submit may be holding a reference to one
+        removed = 0
+        for heap in self._heaps.values():
+            kept = [item for item in heap if item[3] is not sink]
+            if len(kept) < len(heap):
+                removed += len(heap) - len(kept)
+                heap[:] = kept
+                heapq.heapify(heap)
+        if removed:
+            self._release(removed)
+
+    async def _work(self) -> None:
+        while True:
+            await self._ready.wait()
+            if not self._size:
+                continue
+            city, chunk = self._take_chunk()
+            requests = [item[2] for item in chunk]
+
+            try:
+                result = await classify_batch_in_chunks(requests, city=city)
+            except Exception as e:
+                result = e
+
+            # hand each caller back only its own requests
+            by_sink = {}
+            for item in chunk:
+                by_sink.setdefault(id(item[3]), (item[3], []))[1].append(item[2])
+            for sink, sink_requests in by_sink.values():
+                await sink.put((sink_requests, result))
+
+classify_queue = ClassificationQueue(settings.classify_workers, settings.classify_queue_max)
@@ -0,0 +1,130 @@
+import sys
+import logging
+from app.core.config import get_settings
+from app.utils.geo import valid_coords, distance_m
+from app.utils.similarity import shingles, jaccard
+from app.utils.time_helper import parse_time
+from app.utils.metrics import DUPLICATES
+import app.services.cache as cache
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('duplicates')
+
+settings = get_settings()
+
+# what a duplicate takes over from its canonical report instead of asking the model
+INHERITED_FIELDS = ('priority', 'flag', 'priority_explanation', 'flag_explanation', 'incident_label')
+
+def _service(request: dict) -> str:
+    return ' '.join(str(request.get('service_name') or '').lower().split())
+
+def _epoch(request: dict) -> float | None:
+    try:
+        return parse_time(request['requested_datetime']).timestamp()
+    except Exception:
+        return None
+
+def _similarity(request: dict, request_shingles: frozenset, candidate: dict, candidate_shingles: frozenset) -> float:
+    # same service, filed close together in time and worded alike; location is checked by the caller
+    if _service(request) != _service(candidate):
+        return 0.0
+    t1, t2 = _epoch(request), _epoch(candidate)
+    if t1 is None or t2 is None or abs(t1 - t2) > settings.dedup_window:
+        return 0.0
+    return jaccard(request_shingles, candidate_shingles)
+
+class DuplicateGroups:
+    # near-duplicate tracking for one pipeline run. New requests are matched against open cached
+    # requests nearby and against canonicals of this run still waiting on the classifier; a match
+    # skips the model and inherits the canonical's classification, linked by `duplicate_of`.
+    def __init__(self, city: str):
+        self.city = city
+        self.pending: dict[str, tuple[dict, frozenset]] = {} # canonicals sent to the classifier
+        self.held: dict[str, list[dict]] = {} # canonical id -> duplicates waiting on its result
+
+    def _inherit(self, request: dict, canonical: dict, canonical_id: str) -> dict:
+        inherited = {field: canonical[field] for field in INHERITED_FIELDS if field in canonical}
+        return request | inherited | {'duplicate_of': canonical_id, 'city': self.city}
+
+    def _match_pending(self, request: dict, request_shingles: frozenset) -> str | None:
+        lon, lat = float(request['long']), float(request['lat'])
+        best, best_score = None, settings.dedup_similarity
+        for canonical_id, (canonical, canonical_shingles) in self.pending.items():
+            if distance_m(lon, lat, float(canonical['long']), float(canonical['lat'])) > settings.dedup_radius:
+                continue
+            score = _similarity(request, request_shingles, canonical, canonical_shingles)
+            if score >= best_score:
+                best, best_score = canonical_id, score
+        return best
+
+    async def split(self, requests: list[dict]) -> tuple[list[dict], dict[str, dict]]:
+        # returns the requests that still need the model, and ready payloads for duplicates of
+        # cached requests; duplicates of pending canonicals are held until resolve()
+        if not settings.dedup_enabled or not requests:
+            return requests, {}
+
+        keyed = [(request, shingles(request.get('description'))) for request in requests]
+        located = [
+            (request, request_shingles) for request, request_shingles in keyed
+            if request_shingles and valid_coords(request.get('long'), request.get('lat'))
+        ]
+        nearby = await cache.find_nearby(
+            self.city,
+            [(float(request['long']), float(request['lat'])) for request, _ in located],
+            settings.dedup_radius,
+            settings.dedup_max_candidates
+        )
+        near = {str(request['service_request_id']): ids for (request, _), ids in zip(located, nearby)}
+        candidates = {
+            str(candidate['service_request_id']): (candidate, shingles(candidate.get('description')))
+            for candidate in await cache.get_requests(self.city, list({i for ids in nearby for i in ids}))
+        }
+
+        to_classify = []
+        inherited = {}
+        for request, request_shingles in keyed:
+            req_id = str(request['service_request_id'])
+            if req_id not in near:
+                to_classify.append(request)
+                continue
+
+            best, best_score = None, settings.dedup_similarity
+            for candidate_id in near[req_id]:
+                if candidate_id == req_id or candidate_id not in candidates:
+                    continue
+                candidate, candidate_shingles = candidates[candidate_id]
+                score = _similarity(request, request_shingles, candidate, candidate_shingles)
+                if score >= best_score:
+                    best, best_score = candidate, score
+
+            if best is not None:
+                # a duplicate of a duplicate joins the original group
+                canonical_id = str(best.get('duplicate_of') or best['service_request_id'])
+                inherited[req_id] = self._inherit(request, best, canonical_id)
+                continue
+
+            canonical_id = self._match_pending(request, request_shingles)
+            if canonical_id is not None:
+                self.held.setdefault(canonical_id, []).append(request)
+                continue
+
+            to_classify.append(request)
+            self.pending[req_id] = (request, request_shingles)
+
+        skipped = len(requests) - len(to_classify)
+        if skipped:
+            DUPLICATES.inc(skipped, city=self.city)
+            log.info('%s: %d of %d new requests are near-duplicates of open reports', self.city, skipped, len(requests))
+        return to_classify, inherited
+
+    def resolve(self, canonical_id: str, canonical: dict | None) -> dict[str, dict]:
+        # payloads for the duplicates held on a canonical once its classification is in; without
+        # one they are dropped and picked up again as new on the next poll
+        self.pending.pop(canonical_id, None)
+        held = self.held.pop(canonical_id, [])
+        if canonical is None:
+            return {}
+        return {str(request['service_request_id']): self._inherit(request, canonical, canonical_id) for request in held}
@@ -3,9 +3,14 @@ import sys
 import logging
 import backoff
 import asyncio
+import json
 from datetime import datetime
+from pydantic import ValidationError
 from app.core.config import get_settings
+from app.models.schemas import Open311Request
 from app.utils.time_helper import format_time
+from app.utils.json_stream import iter_json_array
+from app.utils.metrics import FETCH_SECONDS, FETCH_ERRORS
 
 settings = get_settings()
 
@@ -16,12 +21,97 @@ logging.basicConfig(
 )
 log = logging.getLogger('georeport-client')
 
+# h2 comes with the httpx[http2] dependency; this only guards a broken install
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    log.warning('h2 is not installed, polling Open311 endpoints over HTTP/1.1')
+
+# one pooled client per city endpoint, reused across pages and poll cycles
+_clients: dict[str, httpx.AsyncClient] = {}
+# caps page fetches in flight across every city this process polls
+_fetch_slots = asyncio.Semaphore(settings.max_concurrent_fetches)
+
+def get_base_url(city: str) -> str:
+    try:
+        return str(settings.cities[city]).rstrip('/')
+    except KeyError:
+        raise ValueError(f'Unknown city: {city}')
+
+def get_client(city: str) -> httpx.AsyncClient:
+    base_url = get_base_url(city)
+    client = _clients.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(connect=5.0, read=45.0, write=10.0, pool=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive,
+                keepalive_expiry=settings.http_keepalive_expiry
+            )
+        )
+        _clients[base_url] = client
+    return client
+
+async def close_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+def _rate_limited(e: Exception) -> bool:
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429
+
+# a few quick retries for blips; persistent failures and 429s go up to the poll
+# scheduler, which backs the whole city off instead of holding a fetch slot
 @backoff.on_exception(
     backoff.expo,
     (httpx.HTTPStatusError, httpx.RemoteProtocolError, httpx.ReadTimeout, 
      httpx.ConnectTimeout, httpx.ConnectError, httpx.TimeoutException),
+    max_tries=settings.fetch_max_tries,
+    giveup=_rate_limited,
     jitter=backoff.full_jitter
 )
+async def _get_requests(city: str, params: dict) -> list[dict]:
+    client = get_client(city)
+
+    page = int(params.get('page', 1))
+    requests = []
+    dropped = 0
+
+    # parsed as it downloads, so the raw body is never held in full; the fetch slot is held
+    # until the body is read so the cap is on requests actually in flight
+    async with _fetch_slots:
+        with FETCH_SECONDS.time(city=city, page=page if page < 10 else '10+'):
+            async with client.stream('GET', '/requests.json', params=params) as response:
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    FETCH_ERRORS.inc(city=city, reason=e.response.status_code)
+                    raise
+
+                try:
+                    async for item in iter_json_array(response.aiter_text()):
+                        if isinstance(item, json.JSONDecodeError):
+                            dropped += 1
+                            continue
+                        try:
+                            requests.append(Open311Request.model_validate(item).model_dump(exclude_unset=True))
+                        except ValidationError:
+                            dropped += 1
+                except ValueError as e:
+                    FETCH_ERRORS.inc(city=city, reason='decode')
+                    log.info('%s: unreadable page %d: %s', city, page, e)
+                    raise
+
+    if dropped:
+        FETCH_ERRORS.inc(dropped, city=city, reason='malformed_item')
+        log.info('%s: dropped %d malformed requests from page %d', city, dropped, page)
+    return requests
+
 async def fetch_open_requests(
     city: str,
     *,
@@ -30,11 +120,6 @@ async def fetch_open_requests(
     page_size: int = 100,
     page: int = 1
 ) -> list[dict]:
-    try:
-        base_url = str(settings.cities[city]).rstrip('/')
-    except KeyError:
-        raise ValueError(f'Unknown city: {city}')
-
     params = {
         'status': 'open',
         'start_date': format_time(start_date),
@@ -42,20 +127,27 @@ async def fetch_open_requests(
         'page_size': page_size,
         'page': page
     }
+    return await _get_requests(city, params)
+
+async def fetch_requests_by_id(city: str, req_ids: list[str]) -> list[dict]:
+    # GeoReport v2 ignores the other filters when ids are given, so closed requests come back too
+    params = {
+        'service_request_id': ','.join(req_ids),
+        'page_size': len(req_ids)
+    }
+    return await _get_requests(city, params)
 
-    timeout = httpx.Timeout(connect=5.0, read=45.0, write=10.0, pool=5.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        response = await client.get(f'{base_url}/requests.json', params=params)
-        response.raise_for_status()
-        try:
-            return response.json()
-        
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:
-                await asyncio.sleep(60)
-                raise
-            raise
-
-        except Exception as e:
-            log.info(f"JSON decode error: {e}, body: {response.text}")
-            return []
+async def fetch_updated_requests(
+    city: str,
+    *,
+    updated_after: datetime,
+    page_size: int = 100,
+    page: int = 1
+) -> list[dict]:
+    # no status filter: closures have to come back so they can be evicted
+    params = {
+        'updated_after': format_time(updated_after),
+        'page_size': page_size,
+        'page': page
+    }
+    return await _get_requests(city, params)
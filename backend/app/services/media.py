@@ -0,0 +1,174 @@
+import sys
+import base64
+import asyncio
+import logging
+import ipaddress
+from io import BytesIO
+from contextlib import asynccontextmanager
+import httpx
+from app.core.config import get_settings
+from app.utils.metrics import MEDIA_CHECKS
+import app.services.cache as cache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('media')
+
+settings = get_settings()
+
+# Pillow is a declared dependency; the guarded import only covers a broken install
+if settings.media_inline and Image is None:
+    log.warning('MEDIA_INLINE is set but Pillow is not installed, sending image urls instead')
+
+# formats the vision models accept
+ALLOWED_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
+HEAD_UNSUPPORTED = {403, 405, 501} # some hosts only answer GET
+INLINE_QUALITY = 80
+MAX_REDIRECTS = 3
+
+_client: httpx.AsyncClient | None = None
+_slots = asyncio.Semaphore(settings.media_concurrency)
+
+def get_client() -> httpx.AsyncClient:
+    # media lives on arbitrary hosts, so one pooled client is shared across all of them
+    global _client
+    if _client is None or _client.is_closed:
+        # redirects are followed by hand in _open so every hop's host is checked
+        _client = httpx.AsyncClient(
+            follow_redirects=False,
+            timeout=settings.media_timeout,
+            limits=httpx.Limits(
+                max_connections=settings.media_concurrency,
+                max_keepalive_connections=settings.media_concurrency,
+                keepalive_expiry=settings.http_keepalive_expiry
+            )
+        )
+    return _client
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def is_candidate(url) -> bool:
+    return isinstance(url, str) and url.startswith('https')
+
+def is_inline(image) -> bool:
+    return isinstance(image, str) and image.startswith('data:image/')
+
+async def _is_public(host: str) -> bool:
+    # every address the host resolves to must be publicly routable, so a report cannot point
+    # the server at loopback, private or link-local addresses
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None)
+    except OSError:
+        return False
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            return False
+    return bool(infos)
+
+@asynccontextmanager
+async def _open(method: str, url: str):
+    for _ in range(MAX_REDIRECTS + 1):
+        parsed = httpx.URL(url)
+        if parsed.scheme != 'https' or not await _is_public(parsed.host):
+            raise ValueError(f'refusing to fetch {url}')
+        async with get_client().stream(method, parsed) as response:
+            if not response.is_redirect:
+                yield response
+                return
+            url = str(response.url.join(response.headers['location']))
+    raise httpx.TooManyRedirects(f'more than {MAX_REDIRECTS} redirects', request=response.request)
+
+async def _fetch_headers(url: str) -> httpx.Response:
+    async with _open('HEAD', url) as response:
+        if response.status_code not in HEAD_UNSUPPORTED:
+            return response
+    async with _open('GET', url) as response:
+        return response # only the headers are needed, the body is never read
+
+def _downscale(data: bytes) -> str:
+    image = Image.open(BytesIO(data))
+    image.thumbnail((settings.media_inline_max_px, settings.media_inline_max_px))
+    out = BytesIO()
+    image.convert('RGB').save(out, format='JPEG', quality=INLINE_QUALITY)
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+
+async def _inline(url: str) -> str:
+    data = bytearray()
+    async with _open('GET', url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            data += chunk
+            if len(data) > settings.media_max_bytes:
+                raise ValueError('image larger than advertised')
+    return await asyncio.to_thread(_downscale, bytes(data))
+
+async def _check(url: str) -> dict:
+    async with _slots:
+        try:
+            response = await _fetch_headers(url)
+        except httpx.HTTPError:
+            return {'ok': False, 'reason': 'error'}
+        except ValueError:
+            return {'ok': False, 'reason': 'blocked'}
+
+        if response.status_code != 200:
+            return {'ok': False, 'reason': 'status'}
+        content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type not in ALLOWED_TYPES:
+            return {'ok': False, 'reason': 'type'}
+        try:
+            size = int(response.headers.get('content-length', 0))
+        except ValueError:
+            size = 0
+        if size > settings.media_max_bytes:
+            return {'ok': False, 'reason': 'too_large'}
+
+        image = url
+        if settings.media_inline and Image is not None:
+            try:
+                image = await _inline(url)
+            except Exception as e:
+                log.info('could not inline %s, sending the url: %s', url, e)
+        return {'ok': True, 'reason': 'ok', 'image': image}
+
+async def check_media(urls: list) -> dict[str, str | None]:
+    # maps each media url to what the model should be sent: the url, an inline data url,
+    # or None to leave the image out of that request only
+    urls = list(dict.fromkeys(url for url in urls if isinstance(url, str)))
+    result = {url: None for url in urls if not is_candidate(url)}
+    candidates = [url for url in urls if is_candidate(url)]
+    if not settings.media_check:
+        return result | {url: url for url in candidates}
+
+    pending = []
+    for url, hit in zip(candidates, await cache.get_media_checks(candidates)):
+        if hit is None:
+            pending.append(url)
+        else:
+            result[url] = hit.get('image')
+            MEDIA_CHECKS.inc(result='cached')
+
+    checks = dict(zip(pending, await asyncio.gather(*(_check(url) for url in pending))))
+    for url, check in checks.items():
+        MEDIA_CHECKS.inc(result=check['reason'])
+        result[url] = check.get('image')
+    await cache.cache_media_checks(checks)
+
+    dropped = sum(1 for check in checks.values() if not check['ok'])
+    if dropped:
+        log.info('dropping %d of %d new media urls that failed checks', dropped, len(checks))
+    return result
@@ -1,5 +1,7 @@
 import sys
 import logging
+import hashlib
+import time
 import openai
 from openai import AsyncOpenAI
 from pathlib import Path
@@ -9,6 +11,17 @@ import backoff
 from itertools import chain
 from app.core.config import get_settings
 from app.models.schemas import ClassifiedPayload, BatchClassifiedPayload
+from app.services.rate_limiter import openai_slot
+from app.services.media import check_media, is_candidate, is_inline
+from app.utils.metrics import (
+    CLASSIFY_SECONDS,
+    CLASSIFY_REQUESTS,
+    OPENAI_TOKENS,
+    MODEL_FALLBACKS,
+    IMAGE_RETRIES,
+    CLASSIFICATION_CACHE
+)
+import app.services.cache as cache
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -17,10 +30,15 @@ logging.basicConfig(
 log = logging.getLogger('openai-client')
 
 settings = get_settings()
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
 
 CLASSIFY_BATCH_PROMPT_PATH = Path(__file__).parents[1] / 'prompts' / 'classify_batch.txt'
 CLASSIFY_BATCH_PROMPT = CLASSIFY_BATCH_PROMPT_PATH.read_text()
+CLASSIFY_BATCH_PROMPT_VERSION = hashlib.sha256(CLASSIFY_BATCH_PROMPT.encode()).hexdigest()[:16]
+
+# bookkeeping fields that change without the report changing; kept out of the prompt
+# so they don't defeat the classification cache
+VOLATILE_FIELDS = ('status', 'updated_datetime', 'expected_datetime')
 
 TRANSIENT_ERRORS = (
     openai.APIConnectionError,
@@ -29,10 +47,30 @@ TRANSIENT_ERRORS = (
     openai.RateLimitError
 )
 
-def _build_model_input(
+IMAGE_TOKENS = 85 # flat cost of a detail='low' image
+OUTPUT_TOKENS_PER_REQUEST = 80
+
+def _prompt_fields(request: dict) -> dict:
+    return {k: v for k, v in request.items() if k not in VOLATILE_FIELDS}
+
+def classification_digest(request: dict) -> str:
+    # the id is only echoed back, so identical reports share an entry
+    content = _prompt_fields(request)
+    content.pop('service_request_id', None)
+    key = json.dumps(
+        [CLASSIFY_BATCH_PROMPT_VERSION, settings.models, content],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def build_model_input(
     requests: list[dict],
-    include_images: bool = True
+    include_images: bool = True,
+    images: dict[str, str | None] | None = None
 ) -> list[dict]:
+    # images maps media urls to what to send, from check_media; without it any https url is sent
     model_input = [
         {'role': 'system', 'content': CLASSIFY_BATCH_PROMPT},
     ]
@@ -42,13 +80,16 @@ def _build_model_input(
 
         next_input['content'] = [{
             'type': 'input_text',
-            'text': json.dumps(request, ensure_ascii=False, separators=(',', ':'))
+            'text': json.dumps(_prompt_fields(request), ensure_ascii=False, separators=(',', ':'))
         }]
 
-        if include_images and 'media_url' in request and isinstance(request['media_url'], str) and request['media_url'].startswith('https'):
+        image = request.get('media_url')
+        if images is not None and is_candidate(image):
+            image = images.get(image)
+        if include_images and (is_candidate(image) or is_inline(image)):
             next_input['content'].append({
                 'type': 'input_image',
-                'image_url': request['media_url'],
+                'image_url': image,
                 'detail': 'low'
             })
 
@@ -56,40 +97,116 @@ def _build_model_input(
     
     return model_input
 
+def _message_tokens(message: dict) -> int:
+    content = message['content']
+    if isinstance(content, str):
+        return len(content) // 4
+
+    tokens = OUTPUT_TOKENS_PER_REQUEST # each user message yields one classification
+    for part in content:
+        if part['type'] == 'input_image':
+            tokens += IMAGE_TOKENS
+        else:
+            tokens += len(part['text']) // 4
+    return tokens
+
+def estimate_tokens(model_input: list[dict]) -> int:
+    # rough local estimate (~4 chars per token) used to pace calls and size chunks
+    return sum(_message_tokens(message) for message in model_input)
+
+def request_tokens(request: dict) -> int:
+    return _message_tokens(build_model_input([request])[1])
+
+SYSTEM_PROMPT_TOKENS = len(CLASSIFY_BATCH_PROMPT) // 4
 
+class ChunkBudget:
+    # per-call token budget for packing chunks; shrinks on slow or failed calls and
+    # creeps back up while calls stay fast
+    def __init__(self):
+        self.max_budget = settings.classify_token_budget
+        self.min_budget = SYSTEM_PROMPT_TOKENS + 500
+        self.budget = self.max_budget
+
+    def record(self, latency: float, ok: bool) -> None:
+        if not ok or latency > settings.classify_target_latency:
+            self.budget = max(self.min_budget, int(self.budget * 0.7))
+        elif latency < settings.classify_target_latency / 2:
+            self.budget = min(self.max_budget, int(self.budget * 1.1))
+
+chunk_budget = ChunkBudget()
+
+def pack_chunks(requests: list[dict]) -> list[list[dict]]:
+    # the system prompt is paid once per call, so fill each call up to the budget
+    chunks = []
+    chunk = []
+    chunk_tokens = SYSTEM_PROMPT_TOKENS
+    for request in requests:
+        tokens = request_tokens(request)
+        if chunk and (chunk_tokens + tokens > chunk_budget.budget or len(chunk) >= settings.classify_max_chunk):
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = SYSTEM_PROMPT_TOKENS
+        chunk.append(request)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+async def _parse(model: str, model_input: list[dict], city: str) -> list[ClassifiedPayload]:
+    async with openai_slot(city, model, estimate_tokens(model_input)) as limits:
+        start = time.monotonic()
+        try:
+            raw = await client.responses.with_raw_response.parse(
+                model=model,
+                input=model_input,
+                text_format=BatchClassifiedPayload
+            )
+        except openai.RateLimitError:
+            CLASSIFY_SECONDS.observe(time.monotonic() - start, model=model, outcome='rate_limited')
+            limits.throttle()
+            raise
+        except (openai.APITimeoutError, openai.InternalServerError):
+            CLASSIFY_SECONDS.observe(time.monotonic() - start, model=model, outcome='error')
+            chunk_budget.record(time.monotonic() - start, ok=False)
+            raise
+        CLASSIFY_SECONDS.observe(time.monotonic() - start, model=model, outcome='ok')
+        chunk_budget.record(time.monotonic() - start, ok=True)
+        limits.sync(raw.headers)
+
+        response = raw.parse()
+        if response.usage:
+            OPENAI_TOKENS.inc(response.usage.input_tokens, model=model, kind='input')
+            OPENAI_TOKENS.inc(response.usage.output_tokens, model=model, kind='output')
+        return response.output_parsed.requests
 
 @backoff.on_exception(
     backoff.expo,
     TRANSIENT_ERRORS,
     jitter=backoff.full_jitter
 )
-async def classify_batch(requests: list[dict]) -> list[ClassifiedPayload]:
-    model_input = _build_model_input(requests)
+async def classify_batch(
+    requests: list[dict],
+    city: str = 'default',
+    images: dict[str, str | None] | None = None
+) -> list[ClassifiedPayload]:
+    model_input = build_model_input(requests, images=images)
 
     for model_idx, model in enumerate(settings.models):
+        CLASSIFY_REQUESTS.inc(len(requests), model=model)
         try:
-            response = await client.responses.parse(
-                model=model,
-                input=model_input,
-                text_format=BatchClassifiedPayload
-            )
-            return response.output_parsed.requests
+            return await _parse(model, model_input, city)
 
-        # handle bad image urls
+        # an image can still fail after its check (expired link, slow host); retry without any
         except openai.BadRequestError as e:
             if e.body['param'] == 'url' and e.body['code'] == 'invalid_value':
+                IMAGE_RETRIES.inc(model=model)
                 try:
-                    model_input_imageless = _build_model_input(requests, include_images=False)
-
-                    response = await client.responses.parse(
-                        model=model,
-                        input=model_input_imageless,
-                        text_format=BatchClassifiedPayload
-                    )
-                    return response.output_parsed.requests
+                    model_input_imageless = build_model_input(requests, include_images=False)
+                    return await _parse(model, model_input_imageless, city)
                 except openai.RateLimitError:
                     if model_idx == len(settings.models) - 1:
                         raise
+                    MODEL_FALLBACKS.inc(model=model)
                     continue
             else:
                 raise
@@ -98,12 +215,50 @@ async def classify_batch(requests: list[dict]) -> list[ClassifiedPayload]:
             if model_idx == len(settings.models) - 1:
                 raise
             log.info('RateLimitError occurred; switching from %s to %s', settings.models[model_idx], settings.models[model_idx+1])
+            MODEL_FALLBACKS.inc(model=model)
             continue
 
-async def classify_batch_in_chunks(requests: list[dict], chunk_size: int = 5) -> list[ClassifiedPayload]:
-    chunks = [requests[i : i + chunk_size] for i in range(0, len(requests), chunk_size)]
+async def split_cached(requests: list[dict]) -> tuple[list[ClassifiedPayload], list[dict], dict[str, str]]:
+    # returns cached classifications, the requests still to classify and their digests by id
+    digests = [classification_digest(request) for request in requests]
+    cached = await cache.get_classifications(digests)
+
+    hits = []
+    uncached = []
+    uncached_digests = {}
+    for request, digest, hit in zip(requests, digests, cached):
+        req_id = str(request['service_request_id'])
+        if hit:
+            hits.append(ClassifiedPayload(**(hit | {'service_request_id': req_id})))
+        else:
+            uncached.append(request)
+            uncached_digests[req_id] = digest
+
+    CLASSIFICATION_CACHE.inc(len(hits), result='hit')
+    CLASSIFICATION_CACHE.inc(len(uncached), result='miss')
+    if hits:
+        log.info('classification cache hit for %d of %d requests', len(hits), len(requests))
+
+    return hits, uncached, uncached_digests
+
+async def remember_classifications(classified: list[ClassifiedPayload], digests: dict[str, str]) -> None:
+    await cache.cache_classifications({
+        digests[str(c.service_request_id)]: c.model_dump(mode='json', exclude={'service_request_id'})
+        for c in classified
+        if str(c.service_request_id) in digests
+    })
+
+async def classify_batch_in_chunks(requests: list[dict], city: str = 'default') -> list[ClassifiedPayload]:
+    results, uncached, uncached_digests = await split_cached(requests)
+
+    # bad images are found up front and dropped per request instead of failing whole chunks
+    images = await check_media([request.get('media_url') for request in uncached])
+    chunks = pack_chunks(uncached)
     
-    tasks = [asyncio.create_task(classify_batch(chunk)) for chunk in chunks]
+    tasks = [asyncio.create_task(classify_batch(chunk, city, images)) for chunk in chunks]
     chunk_results = await asyncio.gather(*tasks) 
-    
-    return list(chain.from_iterable(chunk_results))
+    classified = list(chain.from_iterable(chunk_results))
+
+    await remember_classifications(classified, uncached_digests)
+
+    return results + classified
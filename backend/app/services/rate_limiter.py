@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from app.core.config import get_settings
+
+settings = get_settings()
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float) -> None:
+        # serialize waiters so a large request can't be starved by a stream of small ones
+        async with self._lock:
+            amount = min(amount, self.capacity)
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def sync(self, limit: float | None, remaining: float | None) -> None:
+        # trust the server's view of the window over our local estimate
+        self._refill()
+        if limit:
+            self.capacity = limit
+            self.rate = limit / 60
+        if remaining is not None:
+            self.tokens = min(self.capacity, remaining)
+
+    def drain(self) -> None:
+        self.tokens = 0
+        self.updated = time.monotonic()
+
+class FairSemaphore:
+    # caps in-flight calls and, when saturated, hands freed slots to waiting keys round-robin
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: dict[str, deque[asyncio.Future]] = {}
+        self._turns: deque[str] = deque()
+
+    async def acquire(self, key: str) -> None:
+        if self.in_use < self.limit and not self._turns:
+            self.in_use += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._waiters:
+            self._waiters[key] = deque()
+            self._turns.append(key)
+        self._waiters[key].append(future)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # slot was handed over as we were cancelled; pass it on
+            else:
+                self._discard(key, future)
+            raise
+
+    def release(self) -> None:
+        while self._turns:
+            key = self._turns.popleft()
+            waiters = self._waiters[key]
+            future = waiters.popleft()
+            if waiters:
+                self._turns.append(key)
+            else:
+                del self._waiters[key]
+            if not future.done():
+                future.set_result(None) # slot passes straight to the waiter
+                return
+        self.in_use -= 1
+
+    def _discard(self, key: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiters[key]
+                self._turns.remove(key)
+
+def _parse_number(value: str | None) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class ModelLimits:
+    def __init__(self):
+        self.requests = TokenBucket(settings.openai_rpm, settings.openai_rpm)
+        self.tokens = TokenBucket(settings.openai_tpm, settings.openai_tpm)
+
+    def sync(self, headers) -> None:
+        self.requests.sync(
+            _parse_number(headers.get('x-ratelimit-limit-requests')),
+            _parse_number(headers.get('x-ratelimit-remaining-requests'))
+        )
+        self.tokens.sync(
+            _parse_number(headers.get('x-ratelimit-limit-tokens')),
+            _parse_number(headers.get('x-ratelimit-remaining-tokens'))
+        )
+
+    def throttle(self) -> None:
+        # a 429 means our estimate was optimistic; drain what we think is left
+        self.requests.drain()
+        self.tokens.drain()
+
+in_flight = FairSemaphore(settings.openai_max_in_flight)
+_model_limits: dict[str, ModelLimits] = {}
+
+def get_model_limits(model: str) -> ModelLimits:
+    if model not in _model_limits:
+        _model_limits[model] = ModelLimits()
+    return _model_limits[model]
+
+@asynccontextmanager
+async def openai_slot(key: str, model: str, est_tokens: int):
+    limits = get_model_limits(model)
+    # the fair slot decides whose call goes next; the buckets then pace it
+    await in_flight.acquire(key)
+    try:
+        await limits.requests.acquire(1)
+        await limits.tokens.acquire(est_tokens)
+        yield limits
+    finally:
+        in_flight.release()
@@ -1,11 +1,17 @@
 import logging
 import asyncio
 import sys
+import time
 from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable
 from app.core.config import get_settings
-from app.services.georeport_client import fetch_open_requests
-from app.services.openai_client import classify_batch_in_chunks as classify_batch
-from app.utils.time_helper import format_time
+from app.services.georeport_client import fetch_open_requests, fetch_updated_requests, fetch_requests_by_id
+from app.services.classify_queue import classify_queue
+from app.services.duplicates import DuplicateGroups
+from app.tasks.shards import ShardCoordinator
+from app.tasks.scheduler import PollScheduler
+from app.utils.time_helper import format_time, parse_time
+from app.utils.metrics import ITEMS_FETCHED, ITEMS_NEW, ITEMS_CACHED, RECONCILED, POLL_SECONDS
 import app.services.cache as cache
 
 logging.basicConfig(
@@ -16,82 +22,291 @@ logging.basicConfig(
 log = logging.getLogger("ingestion")
 settings = get_settings()
 
-async def poll_city(city: str) -> None:
+WINDOW = timedelta(days=1)
+WATERMARK_OVERLAP = timedelta(seconds=60) # re-ask for a little history to tolerate clock skew
+
+_DONE = object() # end-of-stream marker passed between pipeline stages
+
+class DeltaFilterIgnored(Exception):
+    # updated_after is an extension to GeoReport v2; an endpoint without it returns everything
+    pass
+
+FetchPage = Callable[[int], Awaitable[list[dict]]]
+SelectRequests = Callable[[list[dict]], Awaitable[list[dict]]]
+
+async def _fetch_stage(fetch_page: FetchPage, outbox: asyncio.Queue) -> None:
+    page = 1
+    last_fetch = 0.0
     while True:
-        end_date = datetime.now(timezone.utc)
-        start_date = end_date - timedelta(days=1)
-        page = 1
-        total_found = 0
-        total_processed = 0
-        seen_ids = set() # keep track of seen ids to diff at end
-
-        # page through open requests between start_date and end_date
-        while True:
-            requests = await fetch_open_requests(
-                city,
-                start_date=start_date,
-                end_date=end_date,
-                page=page,
-                page_size=100
-            )
-            if not requests:
-                break
-
-            # filter out processed requests
-            new_requests = []
-            for request in requests:
-                req_id = str(request['service_request_id'])
-                seen_ids.add(req_id)
-
-                if await cache.is_cached(city, req_id):
-                    continue
-                new_requests.append(request)
-
-            # classify new requests and cache them
-            if new_requests:
-                log.info(f'{city}: page {page}, about to classify {len(new_requests)}')
-                classifications = await classify_batch(new_requests)
-
-                classified_id_mappings = {str(c.service_request_id): c for c in classifications}
-                missing = []
-
-                for request in new_requests:
-                    req_id = str(request['service_request_id'])
-                    classified = classified_id_mappings.get(req_id)
-                    if not classified:
-                        missing.append(req_id)
-                        continue
-                    payload = request | classified.model_dump()
-                    payload['city'] = city
-                    await cache.cache_request(city, req_id, payload)
-                
-                if missing:
-                    log.info('%s: missing classifications for ids: %s', city, missing)
-
-            log.info("%s: page %d fetched %d items and processed %d", city, page, len(requests), len(new_requests))
-
-            page += 1
-            total_found += len(requests)
-            total_processed += len(new_requests)
-
-            await asyncio.sleep(settings.poll_interval)
-    
-        cached_ids = await cache.get_cached_ids(city)
-        closed_ids = cached_ids - seen_ids
-
-        for req_id in closed_ids:
-            await cache.evict_request(city, req_id)
-
-        log.info(
-            '%s: poller fetched %d requests between %s - %s and processed %d', 
-            city, 
-            total_found, 
-            format_time(start_date), 
-            format_time(end_date), 
-            total_processed
+        # optional rate limit between page requests
+        wait = settings.page_interval - (time.monotonic() - last_fetch)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        last_fetch = time.monotonic()
+
+        requests = await fetch_page(page)
+        if not requests:
+            break
+        await outbox.put((page, requests))
+        page += 1
+
+    await outbox.put(_DONE)
+
+async def _dedupe_stage(
+    city: str,
+    select: SelectRequests,
+    groups: DuplicateGroups,
+    inbox: asyncio.Queue,
+    outbox: asyncio.Queue,
+    stats: dict
+) -> None:
+    in_flight = set() # ids already handled in this run
+    submitted = 0 # of those, how many went to the classifier
+    while (item := await inbox.get()) is not _DONE:
+        page, requests = item
+
+        # filter out processed requests
+        candidates = {}
+        for request in await select(requests):
+            req_id = str(request['service_request_id'])
+            if req_id not in in_flight:
+                candidates.setdefault(req_id, request)
+
+        uncached_ids = await cache.filter_uncached(city, list(candidates))
+        in_flight.update(uncached_ids)
+        new_requests = [candidates[req_id] for req_id in uncached_ids]
+
+        log.info("%s: page %d fetched %d items, %d new", city, page, len(requests), len(new_requests))
+        stats['found'] += len(requests)
+        stats['new'] += len(new_requests)
+        ITEMS_FETCHED.inc(len(requests), city=city)
+        ITEMS_NEW.inc(len(new_requests), city=city)
+
+        # near-duplicates of open reports skip the model
+        to_classify, inherited = await groups.split(new_requests)
+        if inherited:
+            await cache.cache_requests(city, inherited)
+            stats['processed'] += len(inherited)
+            ITEMS_CACHED.inc(len(inherited), city=city)
+
+        # classified results come back on outbox, most urgent-looking first
+        if to_classify:
+            submitted += len(to_classify)
+            await classify_queue.submit(city, to_classify, outbox)
+
+    await outbox.put((_DONE, submitted))
+
+async def _persist_stage(city: str, groups: DuplicateGroups, inbox: asyncio.Queue, stats: dict) -> None:
+    received = 0
+    expected = None
+    while expected is None or received < expected:
+        new_requests, classifications = await inbox.get()
+        if new_requests is _DONE:
+            expected = classifications
+            continue
+        received += len(new_requests)
+
+        if isinstance(classifications, Exception):
+            raise classifications
+
+        classified_id_mappings = {str(c.service_request_id): c for c in classifications}
+        missing = []
+        payloads = {}
+
+        for request in new_requests:
+            req_id = str(request['service_request_id'])
+            classified = classified_id_mappings.get(req_id)
+            if not classified:
+                missing.append(req_id)
+                groups.resolve(req_id, None)
+                continue
+            payload = request | classified.model_dump()
+            payload['city'] = city
+            payloads[req_id] = payload
+            # duplicates found while this one was being classified take its result
+            payloads |= groups.resolve(req_id, payload)
+
+        await cache.cache_requests(city, payloads)
+
+        if missing:
+            log.info('%s: missing classifications for ids: %s', city, missing)
+
+        stats['processed'] += len(payloads)
+        ITEMS_CACHED.inc(len(payloads), city=city)
+
+# streams pages through fetch -> dedupe -> classify -> persist; fetching runs at most
+# settings.pipeline_depth pages ahead of dedupe, and the shared classification queue
+# orders new requests by urgency across pages and cities
+async def run_pipeline(city: str, fetch_page: FetchPage, select: SelectRequests) -> dict:
+    fetched = asyncio.Queue(maxsize=settings.pipeline_depth)
+    classified = asyncio.Queue()
+    groups = DuplicateGroups(city)
+    stats = {'found': 0, 'new': 0, 'processed': 0}
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(_fetch_stage(fetch_page, fetched))
+            tg.create_task(_dedupe_stage(city, select, groups, fetched, classified, stats))
+            tg.create_task(_persist_stage(city, groups, classified, stats))
+    finally:
+        # nothing is left for a run that completed; a failed or cancelled one leaves its rest behind
+        classify_queue.discard(classified)
+
+    return stats
+
+async def full_sweep(city: str) -> tuple[datetime, dict]:
+    end_date = datetime.now(timezone.utc)
+    start_date = end_date - WINDOW
+
+    # page through open requests between start_date and end_date
+    async def fetch_page(page: int) -> list[dict]:
+        return await fetch_open_requests(
+            city,
+            start_date=start_date,
+            end_date=end_date,
+            page=page,
+            page_size=100
         )
-        await asyncio.sleep(settings.poll_interval)
 
-async def start_pollers():
-    for city in settings.cities:
-        asyncio.create_task(poll_city(city))
+    # closures are left to reconcile(); being listed here only confirms a request is open
+    async def select(requests: list[dict]) -> list[dict]:
+        await cache.confirm_requests(city, [str(request['service_request_id']) for request in requests])
+        return requests
+
+    stats = await run_pipeline(city, fetch_page, select)
+
+    log.info(
+        '%s: full sweep fetched %d requests between %s - %s and processed %d',
+        city,
+        stats['found'],
+        format_time(start_date),
+        format_time(end_date),
+        stats['processed']
+    )
+    return end_date, stats
+
+async def delta_poll(city: str, watermark: datetime) -> tuple[datetime, dict]:
+    window_start = datetime.now(timezone.utc) - WINDOW
+    updated_after = watermark - WATERMARK_OVERLAP
+    new_watermark = watermark
+    total_closed = 0
+
+    # page through everything (open or closed) updated since the watermark
+    async def fetch_page(page: int) -> list[dict]:
+        return await fetch_updated_requests(
+            city,
+            updated_after=updated_after,
+            page=page,
+            page_size=100
+        )
+
+    async def select(requests: list[dict]) -> list[dict]:
+        nonlocal new_watermark, total_closed
+        open_requests = []
+        closed_ids = []
+        for request in requests:
+            try:
+                updated = parse_time(request['updated_datetime'])
+            except Exception:
+                updated = None
+            if updated is not None:
+                if updated < updated_after:
+                    # stop before paging through the whole unfiltered listing
+                    raise DeltaFilterIgnored(f'{city} returned a request updated at {format_time(updated)}')
+                new_watermark = max(new_watermark, updated)
+
+            if request.get('status', 'open') != 'open':
+                closed_ids.append(str(request['service_request_id']))
+                continue
+
+            # only requests inside the sweep window are newly ingested
+            try:
+                if parse_time(request['requested_datetime']) < window_start:
+                    continue
+            except Exception:
+                pass
+            open_requests.append(request)
+
+        if closed_ids:
+            total_closed += await cache.evict_requests(city, closed_ids)
+        await cache.confirm_requests(city, [str(request['service_request_id']) for request in open_requests])
+
+        return open_requests
+
+    stats = await run_pipeline(city, fetch_page, select)
+
+    log.info(
+        '%s: delta poll fetched %d requests updated after %s, processed %d and closed %d',
+        city,
+        stats['found'],
+        format_time(updated_after),
+        stats['processed'],
+        total_closed
+    )
+    return new_watermark, stats | {'closed': total_closed}
+
+async def reconcile(city: str) -> int:
+    # looks up cached requests that no sweep or delta has confirmed open for a while, oldest
+    # first, a batch of ids per call and at most settings.reconcile_budget calls per round
+    cutoff = time.time() - settings.reconcile_after
+    stale = await cache.get_unconfirmed(city, cutoff, settings.reconcile_batch_size * settings.reconcile_budget)
+    closed = 0
+
+    for i in range(0, len(stale), settings.reconcile_batch_size):
+        batch = stale[i : i + settings.reconcile_batch_size]
+        upstream = {str(r['service_request_id']): r for r in await fetch_requests_by_id(city, batch)}
+        if not upstream.keys() & set(batch):
+            # an upstream that ignores the id filter says nothing about these, so keep them for now
+            log.info('%s: id lookup returned none of %d stale requests, skipping', city, len(batch))
+            continue
+
+        still_open = [req_id for req_id in batch if req_id in upstream and upstream[req_id].get('status', 'open') == 'open']
+        confirmed = set(await cache.confirm_requests(city, still_open))
+        # closed, gone upstream while the rest of the batch was found, or open but with its
+        # payload already expired locally
+        gone = [req_id for req_id in batch if req_id not in confirmed]
+        if gone:
+            closed += await cache.evict_requests(city, gone)
+
+        RECONCILED.inc(len(confirmed), city=city, result='open')
+        RECONCILED.inc(len(gone), city=city, result='evicted')
+
+    if stale:
+        log.info('%s: reconciled %d stale requests, evicted %d', city, len(stale), closed)
+    return closed
+
+async def poll_once(city: str, sweep_due: bool, reconcile_due: bool) -> dict:
+    # one scheduled cycle; the scheduler turns the changes seen into the city's next interval
+    delta = settings.delta_polling and not await cache.is_delta_disabled(city)
+    watermark = await cache.get_watermark(city) if delta else None
+    swept = watermark is None or sweep_due
+
+    if not swept:
+        try:
+            with POLL_SECONDS.time(city=city, mode='delta'):
+                watermark, stats = await delta_poll(city, watermark)
+        except* DeltaFilterIgnored as e:
+            log.info('%s: endpoint ignores updated_after (%s), full sweeps only for %ds',
+                     city, e.exceptions[0], settings.delta_recheck_interval)
+            await cache.disable_delta(city, settings.delta_recheck_interval)
+            swept = True
+
+    if swept:
+        # periodic full reconciliation catches closures a delta could miss
+        with POLL_SECONDS.time(city=city, mode='full'):
+            watermark, stats = await full_sweep(city)
+
+    await cache.set_watermark(city, watermark)
+
+    if reconcile_due:
+        with POLL_SECONDS.time(city=city, mode='reconcile'):
+            await reconcile(city)
+
+    return {'swept': swept, 'changes': stats['new'] + stats.get('closed', 0)}
+
+async def run_pollers() -> None:
+    # each replica polls only the cities it holds a lease for, all from one scheduler
+    scheduler = PollScheduler(poll_once)
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(scheduler.run())
+        tg.create_task(ShardCoordinator(list(settings.cities), scheduler.add, scheduler.remove).run())
@@ -0,0 +1,27 @@
+import sys
+import logging
+from app.services.archive import archive
+import app.services.cache as cache
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('replay')
+
+async def replay_city(city: str) -> int:
+    # rebuilds the city's working set from archived classifications without calling the model,
+    # however old they are; the next sweep and reconciliation confirm or evict what was restored
+    total = 0
+    async for payloads in archive.latest(city):
+        await cache.cache_requests(city, {str(p['service_request_id']): p for p in payloads}, archived=False)
+        total += len(payloads)
+    log.info('%s: replayed %d requests from the archive', city, total)
+    return total
+
+async def replay_missing(cities: list[str]) -> None:
+    # only cities with nothing in Redis, e.g. after a flush, so a normal restart does no work;
+    # a city this replica never owned has nothing in its archive and replays nothing
+    for city in cities:
+        if await cache.get_watermark(city) is None and not await cache.redis.scard(cache.open_set_key(city)):
+            await replay_city(city)
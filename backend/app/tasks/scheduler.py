@@ -0,0 +1,155 @@
+import sys
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable
+import httpx
+from app.core.config import get_settings
+from app.utils.metrics import POLL_INTERVAL, POLL_FAILURES
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('scheduler')
+
+settings = get_settings()
+
+LATENCY_MULTIPLE = 2 # a city is never polled more often than twice its cycle time
+RATE_LIMIT_BACKOFF = 60 # seconds to wait after a 429 without a usable Retry-After
+
+# (city, sweep_due, reconcile_due) -> {'swept': bool, 'changes': int}
+PollCycle = Callable[[str, bool, bool], Awaitable[dict]]
+
+def _ewma(current: float | None, value: float) -> float:
+    if current is None:
+        return value
+    return current + settings.poll_ewma_alpha * (value - current)
+
+def _rate_limited(e: BaseException) -> httpx.Response | None:
+    # pipeline failures arrive wrapped in the TaskGroup's exception group
+    if isinstance(e, BaseExceptionGroup):
+        for inner in e.exceptions:
+            response = _rate_limited(inner)
+            if response is not None:
+                return response
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+        return e.response
+    return None
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return max(float(response.headers.get('retry-after')), 0)
+    except (TypeError, ValueError):
+        return RATE_LIMIT_BACKOFF
+
+class _CityState:
+    def __init__(self):
+        self.interval = float(settings.poll_interval)
+        self.next_due = time.monotonic()
+        self.rate: float | None = None # new or closed requests per second
+        self.latency: float | None = None # seconds per cycle
+        self.failures = 0
+        self.last_start: float | None = None
+        self.last_full_sweep: float | None = None
+        self.last_reconcile = time.monotonic()
+
+    def next_interval(self) -> float:
+        if self.rate is None:
+            interval = settings.poll_interval
+        elif self.rate > 0:
+            # aim for about poll_target_changes changes per cycle
+            interval = settings.poll_target_changes / self.rate
+        else:
+            interval = settings.poll_max_interval
+        # slow upstreams are polled less often so one city cannot hog the fetch slots
+        interval = max(interval, (self.latency or 0) * LATENCY_MULTIPLE)
+        return min(max(interval, settings.poll_min_interval), settings.poll_max_interval)
+
+class PollScheduler:
+    # one loop for every city this replica owns: each city gets a single poll cycle whenever it
+    # comes due, and its next due time follows its recent change rate, cycle latency and
+    # failures. Concurrent page fetches are capped separately in the georeport client.
+    def __init__(self, poll: PollCycle):
+        self._poll = poll
+        self._cities: dict[str, _CityState] = {}
+        self._running: dict[str, asyncio.Task] = {}
+        self._wake = asyncio.Event()
+
+    def add(self, city: str) -> None:
+        if city not in self._cities:
+            self._cities[city] = _CityState()
+            self._wake.set()
+
+    def remove(self, city: str) -> None:
+        self._cities.pop(city, None)
+        task = self._running.pop(city, None)
+        if task:
+            task.cancel()
+
+    def _finished(self, city: str, task: asyncio.Task) -> None:
+        if self._running.get(city) is task:
+            del self._running[city]
+        self._wake.set()
+
+    async def _cycle(self, city: str, state: _CityState) -> None:
+        start = time.monotonic()
+        sweep_due = state.last_full_sweep is None or start - state.last_full_sweep >= settings.full_sweep_interval
+        reconcile_due = start - state.last_reconcile >= settings.reconcile_interval
+
+        try:
+            result = await self._poll(city, sweep_due, reconcile_due)
+        except Exception as e:
+            self._failed(city, state, e)
+            return
+
+        end = time.monotonic()
+        if result['swept']:
+            state.last_full_sweep = start
+        if reconcile_due:
+            state.last_reconcile = end
+
+        state.latency = _ewma(state.latency, end - start)
+        # the first cycle backfills the whole window, which says nothing about the current rate
+        if state.last_start is not None:
+            state.rate = _ewma(state.rate, result['changes'] / max(start - state.last_start, 1e-3))
+        state.last_start = start
+        state.failures = 0
+
+        state.interval = state.next_interval()
+        state.next_due = start + state.interval
+        POLL_INTERVAL.set(state.interval, city=city)
+
+    def _failed(self, city: str, state: _CityState, e: Exception) -> None:
+        state.failures += 1
+        delay = min(settings.poll_max_backoff, max(state.interval, settings.poll_min_interval) * 2 ** state.failures)
+        # jittered so cities sharing an upstream do not retry in lockstep
+        delay = random.uniform(delay / 2, delay)
+        response = _rate_limited(e)
+        if response is not None:
+            delay = max(delay, _retry_after(response))
+        state.next_due = time.monotonic() + delay
+
+        POLL_FAILURES.inc(city=city, reason='rate_limited' if response is not None else 'error')
+        log.info('%s: poll failed (%d in a row), retrying in %.0fs: %r', city, state.failures, delay, e)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                self._wake.clear()
+                now = time.monotonic()
+                for city, state in self._cities.items():
+                    if city not in self._running and state.next_due <= now:
+                        task = asyncio.create_task(self._cycle(city, state))
+                        self._running[city] = task
+                        task.add_done_callback(lambda task, city=city: self._finished(city, task))
+
+                idle = [state.next_due for city, state in self._cities.items() if city not in self._running]
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(min(idle) - now, 0) if idle else None)
+                except TimeoutError:
+                    pass
+        finally:
+            for task in self._running.values():
+                task.cancel()
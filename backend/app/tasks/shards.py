@@ -0,0 +1,101 @@
+import os
+import sys
+import math
+import time
+import uuid
+import socket
+import asyncio
+import hashlib
+import logging
+from typing import Callable
+from app.core.config import get_settings
+import app.services.cache as cache
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO
+)
+log = logging.getLogger('shards')
+
+settings = get_settings()
+
+def _weight(worker_id: str, city: str) -> int:
+    return int.from_bytes(hashlib.sha1(f'{worker_id}:{city}'.encode()).digest()[:8], 'big')
+
+class ShardCoordinator:
+    # splits cities across ingest replicas with one Redis lease per city. Every tick a worker
+    # heartbeats, renews what it holds, hands back anything over its fair share and picks up
+    # free cities, preferring those it wins under rendezvous hashing so ownership is stable.
+    def __init__(self, cities: list[str], start: Callable[[str], None], stop: Callable[[str], None]):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.cities = list(cities)
+        self.owned: set[str] = set()
+        self._start = start
+        self._stop = stop
+        self._last_renewal = time.monotonic()
+
+    def _ranked(self, workers: list[str]) -> list[str]:
+        def rank(city):
+            winner = max(workers, key=lambda w: _weight(w, city))
+            return winner != self.worker_id, -_weight(self.worker_id, city)
+        return sorted(self.cities, key=rank)
+
+    def _drop(self, city: str) -> None:
+        self.owned.discard(city)
+        self._stop(city)
+
+    async def _balance(self) -> None:
+        ttl_ms = int(settings.lease_ttl * 1000)
+        workers = await cache.heartbeat_worker(self.worker_id, ttl_ms)
+
+        owned = sorted(self.owned)
+        for city, held in zip(owned, await cache.renew_leases(owned, self.worker_id, ttl_ms)):
+            if not held:
+                log.info('%s: lease lost, stopping poller', city)
+                self._drop(city)
+        self._last_renewal = time.monotonic()
+
+        share = math.ceil(len(self.cities) / max(len(workers), 1))
+        ranked = self._ranked(workers or [self.worker_id])
+
+        # a replica joined: hand back the least preferred cities for it to pick up
+        extra = [city for city in reversed(ranked) if city in self.owned][:max(len(self.owned) - share, 0)]
+        if extra:
+            await cache.release_leases(extra, self.worker_id)
+            for city in extra:
+                log.info('%s: released to rebalance across %d workers', city, len(workers))
+                self._drop(city)
+
+        for city in ranked:
+            if len(self.owned) >= share:
+                break
+            if city in self.owned:
+                continue
+            if await cache.acquire_lease(city, self.worker_id, ttl_ms):
+                log.info('%s: lease acquired by %s', city, self.worker_id)
+                self.owned.add(city)
+                self._start(city)
+
+    async def run(self) -> None:
+        try:
+            while True:
+                try:
+                    await self._balance()
+                except Exception as e:
+                    log.info('lease balancing failed: %s', e)
+                    # without renewals another worker may take over, so stop before that can happen
+                    if self.owned and time.monotonic() - self._last_renewal >= settings.lease_ttl * 2 / 3:
+                        log.info('leases could not be renewed, stopping %d pollers', len(self.owned))
+                        for city in list(self.owned):
+                            self._drop(city)
+                await asyncio.sleep(settings.lease_ttl / 3)
+        finally:
+            owned = list(self.owned)
+            for city in owned:
+                self._drop(city)
+            # hand over straight away instead of waiting for the leases to expire
+            try:
+                await cache.release_leases(owned, self.worker_id)
+                await cache.remove_worker(self.worker_id)
+            except Exception as e:
+                log.info('could not release leases: %s', e)
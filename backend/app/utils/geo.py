@@ -0,0 +1,58 @@
+import math
+
+EARTH_RADIUS_M = 6_372_797.560856 # the radius Redis uses for its GEO commands
+MAX_LATITUDE = 85.05112878 # GEOADD rejects anything beyond the web mercator limit
+CELLS_PER_TILE = 4 # clustering grid, roughly 64px cells on 256px map tiles
+
+def valid_coords(lon, lat) -> bool:
+    try:
+        lon, lat = float(lon), float(lat)
+    except (TypeError, ValueError):
+        return False
+    # 0,0 is what many Open311 servers send for "no location"
+    return -180 <= lon <= 180 and -MAX_LATITUDE <= lat <= MAX_LATITUDE and (lon, lat) != (0, 0)
+
+def distance_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def bbox_search_box(min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> tuple[float, float, float, float]:
+    # center and a width/height in metres that covers the whole bbox; GEOSEARCH boxes are
+    # centered rectangles, so the widest parallel decides the width and results get trimmed after
+    lon, lat = (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+    widest_lat = 0 if min_lat <= 0 <= max_lat else min(abs(min_lat), abs(max_lat))
+    # arc lengths rather than distances, so a bbox spanning the whole globe stays whole
+    width = math.radians(max_lon - min_lon) * EARTH_RADIUS_M * math.cos(math.radians(widest_lat))
+    height = math.radians(max_lat - min_lat) * EARTH_RADIUS_M
+    return lon, lat, max(width, 1.0), max(height, 1.0)
+
+def cluster(points: list[tuple[str, float, float, float]], zoom: int) -> list[dict]:
+    # points are (member, lon, lat, priority); grid cells shrink by half per zoom level
+    cell = 360 / (2 ** zoom * CELLS_PER_TILE)
+    cells = {}
+    for member, lon, lat, priority in points:
+        key = (math.floor(lon / cell), math.floor(lat / cell))
+        entry = cells.get(key)
+        if entry is None:
+            entry = cells[key] = {'count': 0, 'lon': 0.0, 'lat': 0.0, 'priority': 0.0, 'max_priority': 0, 'id': member}
+        entry['count'] += 1
+        entry['lon'] += lon
+        entry['lat'] += lat
+        entry['priority'] += priority
+        entry['max_priority'] = max(entry['max_priority'], priority)
+
+    return [
+        {
+            'lat': round(entry['lat'] / entry['count'], 6),
+            'long': round(entry['lon'] / entry['count'], 6),
+            'count': entry['count'],
+            'avg_priority': round(entry['priority'] / entry['count'], 1),
+            'max_priority': entry['max_priority'],
+            # single-item cells keep their id so the map can show them as plain markers
+            **({'id': entry['id']} if entry['count'] == 1 else {})
+        }
+        for entry in cells.values()
+    ]
@@ -0,0 +1,26 @@
+from fastapi import Request, Response
+from app.services.cache import CachedResponse
+
+def send_cached(request: Request, entry: CachedResponse) -> Response:
+    headers = {
+        'ETag': entry.etag,
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': 'no-cache', # clients may keep it but must revalidate
+        **entry.headers
+    }
+
+    if_none_match = request.headers.get('if-none-match', '')
+    if entry.etag in (tag.strip() for tag in if_none_match.split(',')) or if_none_match.strip() == '*':
+        return Response(status_code=304, headers=headers)
+
+    accepted = {e.split(';')[0].strip() for e in request.headers.get('accept-encoding', '').split(',')}
+    body = entry.body
+    if 'br' in accepted:
+        body = entry.br_body
+        headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        body = entry.gzip_body
+        headers['Content-Encoding'] = 'gzip'
+
+    # bytes go out as-is; no jsonable_encoder or re-serialization on the hot path
+    return Response(content=body, media_type='application/json', headers=headers)
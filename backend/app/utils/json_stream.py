@@ -0,0 +1,106 @@
+import re
+import json
+from typing import Any, AsyncIterator
+
+_decoder = json.JSONDecoder()
+_SEPARATORS = re.compile(r'[\s,]*')
+_SCALAR = re.compile(r'[^\s,\]]*') # a number, true, false or null runs up to the next delimiter
+
+def _find_item_end(buf: str, pos: int) -> int | None:
+    # where the array element starting at pos ends, or None if the buffer holds only part
+    # of it; used to step over elements the decoder rejects
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(pos, len(buf)):
+        c = buf[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in '{[':
+            depth += 1
+        elif c in '}]':
+            if depth == 0:
+                return i # the closing bracket of the outer array
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        elif c == ',' and depth == 0:
+            return i
+    return None
+
+async def iter_json_array(chunks: AsyncIterator[str]) -> AsyncIterator[Any]:
+    # yields the elements of a top-level JSON array as the text arrives; an element that does
+    # not parse is yielded as its JSONDecodeError so the caller can skip it and carry on.
+    # Raises ValueError if the body is not an array at all or ends before the array does.
+    buf = ''
+    pos = 0
+    started = False
+    finished = False
+
+    async def feed():
+        async for chunk in chunks:
+            yield chunk, False
+        yield '', True
+
+    async for chunk, final in feed():
+        buf = buf[pos:] + chunk
+        pos = 0
+
+        while not finished:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError(f'expected a JSON array, got {buf[pos:pos + 80]!r}')
+                started = True
+                pos += 1
+                continue
+
+            if buf[pos] == ']':
+                finished = True
+                break
+
+            if buf[pos] not in '{["':
+                # a prefix of a number can decode on its own ('-0' of '-0.5', '1' of '1e5'),
+                # so nothing is decoded until the delimiter after it has arrived
+                token_end = _SCALAR.match(buf, pos).end()
+                if token_end == len(buf) and not final:
+                    break
+                try:
+                    item, end = _decoder.raw_decode(buf[:token_end], pos)
+                    if end != token_end:
+                        raise json.JSONDecodeError('Extra data', buf, end)
+                except json.JSONDecodeError as e:
+                    pos = token_end
+                    yield e
+                    continue
+                pos = end
+                yield item
+                continue
+
+            try:
+                item, end = _decoder.raw_decode(buf, pos)
+                pos = end
+                yield item
+            except json.JSONDecodeError as e:
+                end = _find_item_end(buf, pos)
+                if end is None and not final:
+                    break # most likely just incomplete
+                pos = end if end is not None else len(buf)
+                yield e
+
+        if finished:
+            return
+
+    if not started:
+        raise ValueError('expected a JSON array, got an empty body')
+    raise ValueError('the body ended before the JSON array was closed')
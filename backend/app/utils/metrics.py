@@ -0,0 +1,153 @@
+import time
+import asyncio
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# a small in-process registry rendered in the Prometheus text format; each process
+# (API worker or ingest replica) exposes its own and Prometheus sums them
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry: list = []
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, key, '', value
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        self._values[tuple(str(labels[name]) for name in self.labels)] = value
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values: dict[tuple, list] = {} # per label set: bucket counts, sum, count
+        _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        idx = bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            entry[0][idx] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', key, f'le="{_format_value(bound)}"', cumulative
+            yield f'{self.name}_bucket', key, 'le="+Inf"', count
+            yield f'{self.name}_sum', key, '', total
+            yield f'{self.name}_count', key, '', count
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, key, extra, value in metric.samples():
+            lines.append(f'{name}{_format_labels(metric.labels, key, extra)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+async def serve(port: int) -> None:
+    # bare HTTP listener for processes without a web framework, e.g. the ingest runner
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass # headers are not needed
+            path = request_line.split(b' ')[1] if request_line.count(b' ') >= 2 else b''
+            if path.split(b'?')[0] == b'/metrics':
+                status, content_type, body = '200 OK', CONTENT_TYPE, render().encode()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', b'not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '0.0.0.0', port)
+    async with server:
+        await server.serve_forever()
+
+# ingest
+FETCH_SECONDS = Histogram('triage_fetch_seconds', 'Open311 page fetch latency.', ('city', 'page'))
+FETCH_ERRORS = Counter('triage_fetch_errors_total', 'Open311 fetches that failed or returned unreadable bodies.', ('city', 'reason'))
+ITEMS_FETCHED = Counter('triage_items_fetched_total', 'Requests returned by Open311.', ('city',))
+ITEMS_NEW = Counter('triage_items_new_total', 'Fetched requests that were not cached yet.', ('city',))
+DUPLICATES = Counter('triage_duplicates_total', 'New requests matched to an open report instead of classified.', ('city',))
+ITEMS_CACHED = Counter('triage_items_cached_total', 'Classified requests written to Redis.', ('city',))
+RECONCILED = Counter('triage_reconciled_total', 'Stale cached requests checked upstream, by outcome.', ('city', 'result'))
+EVICTIONS = Counter('triage_evictions_total', 'Requests evicted from the open set.', ('city',))
+POLL_SECONDS = Histogram('triage_poll_seconds', 'Duration of one full sweep, delta poll or reconciliation round.', ('city', 'mode'))
+POLL_INTERVAL = Gauge('triage_poll_interval_seconds', 'Current adaptive poll interval.', ('city',))
+POLL_FAILURES = Counter('triage_poll_failures_total', 'Poll cycles that failed and were backed off.', ('city', 'reason'))
+
+ARCHIVE_ROWS = Counter('triage_archive_rows_total', 'Rows written to the request archive, by event.', ('event',))
+ARCHIVE_ERRORS = Counter('triage_archive_errors_total', 'Rows the request archive failed to write.')
+
+# classification
+CLASSIFY_SECONDS = Histogram('triage_classify_seconds', 'Latency of one classification call.', ('model', 'outcome'))
+CLASSIFY_REQUESTS = Counter('triage_classify_requests_total', 'Requests sent to the model.', ('model',))
+OPENAI_TOKENS = Counter('triage_openai_tokens_total', 'Tokens used, by model and direction.', ('model', 'kind'))
+MODEL_FALLBACKS = Counter('triage_model_fallbacks_total', 'Rate-limited calls moved on to the next model.', ('model',))
+IMAGE_RETRIES = Counter('triage_image_retries_total', 'Calls retried without images after a bad image URL.', ('model',))
+MEDIA_CHECKS = Counter('triage_media_checks_total', 'Media URL checks, by outcome.', ('result',))
+CLASSIFICATION_CACHE = Counter('triage_classification_cache_total', 'Classification cache lookups.', ('result',))
+
+# redis
+REDIS_SECONDS = Histogram('triage_redis_seconds', 'Latency of Redis scripts and pipelines.', ('op',))
+
+# api
+HTTP_SECONDS = Histogram('triage_http_request_seconds', 'API request latency by route.', ('method', 'route', 'status'))
@@ -0,0 +1,16 @@
+import re
+
+SHINGLE_SIZE = 3
+_NON_WORD = re.compile(r'[\W_]+')
+
+def shingles(text: str | None, size: int = SHINGLE_SIZE) -> frozenset[str]:
+    # character n-grams of the normalized text; short reports still get enough to compare
+    normalized = ' '.join(_NON_WORD.sub(' ', str(text or '').lower()).split())
+    if len(normalized) <= size:
+        return frozenset([normalized]) if normalized else frozenset()
+    return frozenset(normalized[i : i + size] for i in range(len(normalized) - size + 1))
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
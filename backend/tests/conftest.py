@@ -0,0 +1,24 @@
+import os
+
+# settings are read at import time, so these must be in place before any app module loads
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('CITIES', '{"test": "http://localhost:8081"}')
+os.environ.setdefault('MODELS', '["o4-mini"]')
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+os.environ['ARCHIVE_PATH'] = ''
+
+import pytest
+import fakeredis
+import app.services.cache as cache
+
+@pytest.fixture
+def redis(monkeypatch):
+    # both clients share one fake server, and the Lua scripts are registered against it
+    server = fakeredis.FakeServer()
+    fake = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(cache, 'redis', fake)
+    monkeypatch.setattr(cache, 'redis_raw', fakeredis.aioredis.FakeRedis(server=server))
+    for name in dir(cache):
+        if name.endswith('_script'):
+            monkeypatch.setattr(cache, name, fake.register_script(getattr(cache, name).script))
+    return fake
@@ -0,0 +1,53 @@
+import json
+import asyncio
+import app.services.cache as cache
+
+CITY = 'test'
+
+def _payload(req_id: str, priority: int, flags: list[str], label: str, **extra) -> dict:
+    return {
+        'service_request_id': req_id,
+        'priority': priority,
+        'flag': flags,
+        'incident_label': label,
+        'requested_datetime': '2024-01-01T10:00:00Z',
+        'lat': 40.0,
+        'long': -75.0,
+        **extra
+    }
+
+def test_update_then_evict_leaves_no_index_behind(redis):
+    async def run():
+        await cache.cache_requests(CITY, {
+            '1': _payload('1', 30, ['VALID'], 'pothole'),
+            '2': _payload('2', 50, ['VALID'], 'pothole', duplicate_of='1')
+        }, archived=False)
+        # re-cached with other tags: the old ones must go, and the priority is replaced
+        await cache.cache_requests(CITY, {'1': _payload('1', 70, ['WRONG_CATEGORY'], 'streetlight')}, archived=False)
+        assert int(await redis.get(cache.priority_sum_key(CITY))) == 120
+        assert await redis.smembers(cache.flag_set_key(CITY, 'VALID')) == {'2'}
+        assert await redis.smembers(cache.label_set_key(CITY, 'pothole')) == {'2'}
+
+        assert await cache.evict_requests(CITY, ['1', '2']) == 2
+        assert int(await redis.get(cache.priority_sum_key(CITY))) == 0
+        assert int(await redis.get(cache.global_num_open_key())) == 0
+        assert await cache.get_rollups(CITY) == await cache.get_rollups(None)
+        # only the counters, generations and the delta stream outlive the requests
+        counters = {cache.priority_sum_key(CITY), cache.global_priority_sum_key(), cache.global_num_open_key()}
+        leftover = [key for key in await redis.keys('*') if key not in counters and ':gen' not in key and 'stream' not in key]
+        assert leftover == []
+
+    asyncio.run(run())
+
+def test_evict_reads_priority_from_legacy_payload(redis):
+    async def run():
+        # cached before the priority zset and meta hash existed
+        await redis.set(cache.req_key(CITY, '9'), json.dumps({'service_request_id': '9', 'priority': 25}))
+        await redis.sadd(cache.open_set_key(CITY), '9')
+        await redis.set(cache.priority_sum_key(CITY), 25)
+        await redis.set(cache.global_num_open_key(), 1)
+
+        assert await cache.evict_requests(CITY, ['9']) == 1
+        assert int(await redis.get(cache.priority_sum_key(CITY))) == 0
+
+    asyncio.run(run())
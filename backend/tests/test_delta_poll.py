@@ -0,0 +1,57 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+import app.services.cache as cache
+import app.tasks.ingest as ingest
+from app.utils.time_helper import format_time
+
+CITY = 'test'
+
+def test_endpoint_ignoring_updated_after_falls_back_to_full_sweeps(redis, monkeypatch):
+    now = datetime.now(timezone.utc)
+    calls = {'delta': 0, 'full': 0}
+
+    async def fetch_updated(city, *, updated_after, page, page_size):
+        # the whole listing, including requests last touched long before the watermark
+        calls['delta'] += 1
+        return [{'service_request_id': '1', 'status': 'closed', 'updated_datetime': format_time(now - timedelta(days=30))}]
+
+    async def fetch_open(city, *, start_date, end_date, page, page_size):
+        calls['full'] += 1
+        return []
+
+    monkeypatch.setattr(ingest, 'fetch_updated_requests', fetch_updated)
+    monkeypatch.setattr(ingest, 'fetch_open_requests', fetch_open)
+
+    async def run():
+        await cache.set_watermark(CITY, now - timedelta(minutes=5))
+
+        # the listing never ends, so returning at all means the delta was abandoned early;
+        # only the pages already fetched ahead of the check were requested
+        assert (await ingest.poll_once(CITY, False, False))['swept']
+        delta_pages = calls['delta']
+        assert delta_pages <= ingest.settings.pipeline_depth + 2
+        assert calls['full'] == 1
+        assert await cache.is_delta_disabled(CITY)
+
+        # later cycles skip the delta request altogether
+        assert (await ingest.poll_once(CITY, False, False))['swept']
+        assert calls == {'delta': delta_pages, 'full': 2}
+
+    asyncio.run(run())
+
+def test_filtered_delta_keeps_delta_polling(redis, monkeypatch):
+    now = datetime.now(timezone.utc)
+
+    async def fetch_updated(city, *, updated_after, page, page_size):
+        if page > 1:
+            return []
+        return [{'service_request_id': '1', 'status': 'closed', 'updated_datetime': format_time(now)}]
+
+    monkeypatch.setattr(ingest, 'fetch_updated_requests', fetch_updated)
+
+    async def run():
+        await cache.set_watermark(CITY, now - timedelta(minutes=5))
+        assert not (await ingest.poll_once(CITY, False, False))['swept']
+        assert not await cache.is_delta_disabled(CITY)
+
+    asyncio.run(run())
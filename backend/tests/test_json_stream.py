@@ -0,0 +1,40 @@
+import json
+import asyncio
+import pytest
+from app.utils.json_stream import iter_json_array
+
+async def _chunks(parts):
+    for part in parts:
+        yield part
+
+def _parse(parts) -> list:
+    async def run():
+        return [item async for item in iter_json_array(_chunks(parts))]
+    return asyncio.run(run())
+
+BODY = '[-0.5, 1e5, {"id": "a,]"}, true, null, 12, "x"]'
+
+def test_every_chunk_boundary_gives_the_same_items():
+    expected = json.loads(BODY)
+    for cut in range(1, len(BODY)):
+        assert _parse([BODY[:cut], BODY[cut:]]) == expected, cut
+
+def test_split_numbers_are_not_yielded_early():
+    assert _parse(['[-0', '.5,1e', '5]']) == [-0.5, 100000.0]
+
+def test_malformed_element_is_yielded_as_an_error():
+    items = _parse(['[1, 2x, {"a": }, 3]'])
+    assert items[0] == 1 and items[-1] == 3
+    assert all(isinstance(item, json.JSONDecodeError) for item in items[1:3])
+
+def test_truncated_array_raises():
+    with pytest.raises(ValueError):
+        _parse(['[{"id": 1}, {"id": 2}'])
+    with pytest.raises(ValueError):
+        _parse(['[1, 2'])
+
+def test_not_an_array_raises():
+    with pytest.raises(ValueError):
+        _parse(['<html>error</html>'])
+    with pytest.raises(ValueError):
+        _parse([''])
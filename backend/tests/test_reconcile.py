@@ -0,0 +1,45 @@
+import json
+import asyncio
+import app.services.cache as cache
+import app.tasks.ingest as ingest
+
+CITY = 'test'
+
+async def _seed_legacy_open(redis, req_id: str, priority: int) -> None:
+    # an open id from before the confirmed zset, whose payload has since expired
+    await redis.sadd(cache.open_set_key(CITY), req_id)
+    await redis.zadd(cache.priority_zset_key(CITY), {req_id: priority})
+    await redis.incrby(cache.priority_sum_key(CITY), priority)
+    await redis.incr(cache.global_num_open_key())
+    await redis.hset(cache.meta_key(CITY), req_id, json.dumps({'p': priority, 't': 0, 'l': '', 'f': []}))
+
+def test_reconcile_evicts_open_ids_cached_before_confirmation(redis, monkeypatch):
+    async def lookup(city, req_ids):
+        return [{'service_request_id': req_id, 'status': 'open'} for req_id in req_ids]
+    monkeypatch.setattr(ingest, 'fetch_requests_by_id', lookup)
+    monkeypatch.setattr(ingest.settings, 'reconcile_after', 0)
+
+    async def run():
+        await _seed_legacy_open(redis, '1', 40)
+        await cache.cache_requests(CITY, {'2': {'service_request_id': '2', 'priority': 10}}, archived=False)
+
+        # invisible to reconcile until it is backfilled
+        assert await ingest.reconcile(CITY) == 0
+        assert await redis.sismember(cache.open_set_key(CITY), '1')
+
+        await cache.backfill_confirmed([CITY])
+        assert await ingest.reconcile(CITY) == 1
+        assert await cache.get_cached_ids(CITY) == {'2'}
+        assert int(await redis.get(cache.priority_sum_key(CITY))) == 10
+        assert await redis.zscore(cache.confirmed_zset_key(CITY), '1') is None
+
+    asyncio.run(run())
+
+def test_backfill_keeps_existing_confirmations(redis):
+    async def run():
+        await cache.cache_requests(CITY, {'2': {'service_request_id': '2', 'priority': 10}}, archived=False)
+        confirmed_at = await redis.zscore(cache.confirmed_zset_key(CITY), '2')
+        await cache.backfill_confirmed([CITY])
+        assert await redis.zscore(cache.confirmed_zset_key(CITY), '2') == confirmed_at
+
+    asyncio.run(run())
@@ -15,6 +15,26 @@ export async function fetchRequestsByCity(city: CityName, signal?: AbortSignal):
   return res.json();
 }
 
+export type RequestDelta =
+  | { type: 'add' | 'update'; city: CityName; id: string; payload: RequestItem }
+  | { type: 'evict'; city: CityName; id: string };
+
+// Live add/update/evict deltas; EventSource reconnects and resumes from the last event id itself.
+// onReset fires when the server no longer has the history to resume, so the caller should refetch.
+export function subscribeToCityEvents(
+  city: CityName,
+  onDelta: (delta: RequestDelta) => void,
+  onReset: () => void,
+): () => void {
+  const source = new EventSource(`${API_BASE}/cities/${encodeURIComponent(city)}/events`);
+  const handle = (type: RequestDelta['type']) => (e: MessageEvent) => onDelta({ type, ...JSON.parse(e.data) });
+  source.addEventListener('add', handle('add'));
+  source.addEventListener('update', handle('update'));
+  source.addEventListener('evict', handle('evict'));
+  source.addEventListener('reset', onReset);
+  return () => source.close();
+}
+
 export async function fetchCityQuickStats(city: CityName, signal?: AbortSignal): Promise<Stats> {
   const res = await fetch(`${API_BASE}/cities/${encodeURIComponent(city)}/quick_stats`, { signal });
   if (!res.ok) throw new Error(`City stats fetch failed: ${res.status}`);
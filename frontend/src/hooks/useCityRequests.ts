@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react';
 import { useCity } from '../CityContext';
-import { fetchRequestsByCity } from '../api';
+import { fetchRequestsByCity, subscribeToCityEvents } from '../api';
 import type { RequestItem } from '../types';
 
 export default function useCityRequests() {
@@ -16,21 +16,38 @@ export default function useCityRequests() {
 
     const cityKey = city ?? "all";  // ✅ convert null to "all"
 
-    fetchRequestsByCity(cityKey, ctrl.signal)
-      .then((raw) =>
-        setItems(
-          raw.map((r) => ({
-            ...r,
-            service_request_id: String(r.service_request_id),
-          }))
+    const load = () =>
+      fetchRequestsByCity(cityKey, ctrl.signal)
+        .then((raw) =>
+          setItems(
+            raw.map((r) => ({
+              ...r,
+              service_request_id: String(r.service_request_id),
+            }))
+          )
         )
-      )
-      .catch((e) => {
-        if (e.name !== 'AbortError') setError(e.message);
-      })
-      .finally(() => setLoad(false));
+        .catch((e) => {
+          if (e.name !== 'AbortError') setError(e.message);
+        })
+        .finally(() => setLoad(false));
 
-    return () => ctrl.abort();
+    // one snapshot, then the server pushes changes instead of us re-fetching
+    const unsubscribe = subscribeToCityEvents(
+      cityKey,
+      (delta) =>
+        setItems((prev) => {
+          const rest = prev.filter((r) => r.service_request_id !== delta.id || r.city !== delta.city);
+          if (delta.type === 'evict') return rest;
+          return [{ ...delta.payload, service_request_id: String(delta.id) }, ...rest];
+        }),
+      load,
+    );
+    load();
+
+    return () => {
+      unsubscribe();
+      ctrl.abort();
+    };
   }, [city]);
 
   return { items, loading, error };
@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
 from pydantic import BaseModel
-import copy
+import random
 
 def parse_time(t: str) -> datetime:
     dt = datetime.fromisoformat(t.replace('Z', '+00:00'))
@@ -19,7 +21,12 @@ class RequestIn(BaseModel):
     long: float | None = None
 
 app = FastAPI()
-db = [] 
+
+# requests by id, plus (epoch, id) lists kept sorted so time windows are a bisect away
+db: dict[str, dict] = {}
+by_requested: list[tuple[float, int]] = []
+open_by_requested: list[tuple[float, int]] = []
+by_updated: list[tuple[float, int]] = []
 
 SERVICES = {
     '1': 'Pothole',
@@ -34,6 +41,38 @@ SERVICES = {
     '10': 'Other',
 }
 
+# fragments for synthetic descriptions
+PLACES = ['near the corner', 'in front of the school', 'by the bus stop', 'outside my house', 'in the alley', 'at the intersection']
+DETAILS = ['for two weeks', 'since yesterday', 'getting worse', 'blocking the sidewalk', 'a hazard for cyclists', 'please fix soon']
+
+def _insert(index: list, epoch: float, req_id: str) -> None:
+    entry = (epoch, int(req_id))
+    if not index or index[-1] <= entry:
+        index.append(entry) # the common case: newest last
+    else:
+        insort(index, entry)
+
+def _remove(index: list, epoch: float, req_id: str) -> None:
+    i = bisect_left(index, (epoch, int(req_id)))
+    if i < len(index) and index[i] == (epoch, int(req_id)):
+        del index[i]
+
+def add_request(request: dict) -> dict:
+    req_id = request['service_request_id']
+    db[req_id] = request
+    _insert(by_requested, parse_time(request['requested_datetime']).timestamp(), req_id)
+    _insert(by_updated, parse_time(request['updated_datetime']).timestamp(), req_id)
+    if request['status'] == 'open':
+        _insert(open_by_requested, parse_time(request['requested_datetime']).timestamp(), req_id)
+    return request
+
+def _window(index: list, after: str | None, before: str | None) -> range:
+    # positions in index, bounds exclusive like the original linear filters; a range so
+    # nothing is copied and slicing it to a page is free
+    lo = bisect_right(index, (parse_time(after).timestamp(), float('inf'))) if after else 0
+    hi = bisect_left(index, (parse_time(before).timestamp(), -1)) if before else len(index)
+    return range(lo, hi)
+
 @app.post('/requests', status_code=201)
 async def create_request(request: RequestIn):
     current_time = datetime.now(timezone.utc)
@@ -49,18 +88,55 @@ async def create_request(request: RequestIn):
 
     new_request = new_request | request.model_dump(exclude_none=True)
 
-    db.append(new_request)
-    return new_request
+    return add_request(new_request)
+
+@app.post('/seed', status_code=201)
+async def seed(count: int = 10_000, days: float = 1, open_ratio: float = 1.0, seed: int = 0, tag: str = ''):
+    # synthetic load spread evenly over the last `days`; tag makes descriptions unique per run
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    span = days * 86400
+    for i in range(count):
+        requested = now - timedelta(seconds=span * (count - i) / count)
+        service_code = rng.choice(list(SERVICES))
+        status = 'open' if rng.random() < open_ratio else 'closed'
+        add_request({
+            'service_request_id': str(len(db)),
+            'status': status,
+            'requested_datetime': format_time(requested),
+            'updated_datetime': format_time(requested),
+            'service_name': SERVICES[service_code],
+            'service_code': service_code,
+            'description': f'{SERVICES[service_code]} {rng.choice(PLACES)}, {rng.choice(DETAILS)}. {tag}'.strip(),
+            'address': f'{rng.randint(1, 9999)} Main St',
+            'lat': round(43.07 + rng.uniform(-0.05, 0.05), 6),
+            'long': round(-89.40 + rng.uniform(-0.05, 0.05), 6),
+        })
+    return {'seeded': count, 'total': len(db)}
+
+@app.post('/reset')
+async def reset():
+    db.clear()
+    by_requested.clear()
+    open_by_requested.clear()
+    by_updated.clear()
+    return 'Success!'
 
 @app.post('/close-request')
 async def close_request(request_id: str):
-    for req in db:
-        if req['service_request_id'] == request_id and req['status'] == 'open':
-            req['status'] = 'closed'
-            return 'Success!'
-        elif req['service_request_id'] == request_id:
-            raise HTTPException(400, 'Request is already closed')
-    raise HTTPException(404, 'Request with given ID couldn\'t be found')
+    req = db.get(request_id)
+    if req is None:
+        raise HTTPException(404, 'Request with given ID couldn\'t be found')
+    if req['status'] != 'open':
+        raise HTTPException(400, 'Request is already closed')
+
+    requested = parse_time(req['requested_datetime']).timestamp()
+    _remove(open_by_requested, requested, request_id)
+    _remove(by_updated, parse_time(req['updated_datetime']).timestamp(), request_id)
+    req['status'] = 'closed'
+    req['updated_datetime'] = format_time(datetime.now(timezone.utc))
+    _insert(by_updated, parse_time(req['updated_datetime']).timestamp(), request_id)
+    return 'Success!'
 
 @app.get('/requests.json')
 async def get_requests(
@@ -68,32 +144,48 @@ async def get_requests(
     service_code: str | None = None,
     start_date: str | None = None,
     end_date: str | None = None,
+    updated_after: str | None = None,
+    updated_before: str | None = None,
     status: str | None = None,
     page: int = 1,
     page_size: int = 50
 ):
-    filtered_db = copy.copy(db)
     if service_request_id:
-        ids = {i.strip() for i in service_request_id.split(',')}
-        filtered_db = [i for i in filtered_db if i['service_request_id'] in ids]
+        ids = [i.strip() for i in service_request_id.split(',')]
+        matches = (db[i] for i in dict.fromkeys(ids) if i in db)
     else:
-        if service_code:
-            codes = {i.strip() for i in service_code.split(',')}
-            filtered_db = [i for i in filtered_db if i['service_code'] in codes]
-        if start_date:
-            start_dt = parse_time(start_date)
-            filtered_db = [i for i in filtered_db if parse_time(i['requested_datetime']) > start_dt]
-        if end_date:
-            end_dt = parse_time(end_date)
-            filtered_db = [i for i in filtered_db if parse_time(i['requested_datetime']) < end_dt]
-        if status:
-            filtered_db = [i for i in filtered_db if i['status'] == status.strip()]
-        
+        # walk the narrowest index, then apply the remaining filters lazily
+        if updated_after or updated_before:
+            index, window = by_updated, _window(by_updated, updated_after, updated_before)
+        elif status and status.strip() == 'open':
+            index, window = open_by_requested, _window(open_by_requested, start_date, end_date)
+        else:
+            index, window = by_requested, _window(by_requested, start_date, end_date)
 
-    start_index = page_size * (page - 1)
-    end_index = page_size * page
+        codes = {i.strip() for i in service_code.split(',')} if service_code else None
+        start_dt = parse_time(start_date) if start_date else None
+        end_dt = parse_time(end_date) if end_date else None
 
-    if start_index >= len(filtered_db):
-        return []
+        def keep(req: dict) -> bool:
+            if codes and req.get('service_code') not in codes:
+                return False
+            if status and req['status'] != status.strip():
+                return False
+            if (updated_after or updated_before) and (start_dt or end_dt):
+                requested = parse_time(req['requested_datetime'])
+                if (start_dt and requested <= start_dt) or (end_dt and requested >= end_dt):
+                    return False
+            return True
 
-    return filtered_db[start_index:end_index]
+        filtered = codes or (status and index is not open_by_requested) or (
+            (updated_after or updated_before) and (start_dt or end_dt)
+        )
+        if not filtered:
+            # every entry in the window matches, so only the page's own offsets are read
+            start_index = page_size * (page - 1)
+            return [db[str(index[i][1])] for i in window[start_index : start_index + page_size]]
+
+        matches = (req for req in (db[str(index[i][1])] for i in window) if keep(req))
+
+    start_index = page_size * (page - 1)
+    return list(islice(matches, start_index, start_index + page_size))
@@ -0,0 +1,164 @@
+from fastapi import FastAPI, HTTPException, UploadFile, Form, Request
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+
+# seconds a batch stays in_progress before it completes
+BATCH_DELAY = float(os.getenv('BATCH_DELAY', '0'))
+# simulated model latency for /v1/responses: a fixed part, a part per classified request,
+# and +/- JITTER as a fraction of the total
+LLM_LATENCY = float(os.getenv('LLM_LATENCY', '0'))
+LLM_LATENCY_PER_REQUEST = float(os.getenv('LLM_LATENCY_PER_REQUEST', '0'))
+LLM_JITTER = float(os.getenv('LLM_JITTER', '0'))
+
+class BatchIn(BaseModel):
+    input_file_id: str
+    endpoint: str
+    completion_window: str
+    metadata: dict | None = None
+
+app = FastAPI()
+files = {}
+batches = {}
+
+def new_id(prefix: str) -> str:
+    return f'{prefix}_{uuid.uuid4().hex[:24]}'
+
+def fake_classification(request: dict) -> dict:
+    # deterministic so repeated runs give the same scores
+    digest = hashlib.sha256(json.dumps(request, sort_keys=True).encode()).digest()
+    return {
+        'service_request_id': str(request.get('service_request_id', '')),
+        'priority': digest[0] % 101,
+        'flag': ['VALID'],
+        'priority_explanation': 'fake classification',
+        'flag_explanation': '',
+        'incident_label': str(request.get('service_name') or 'unknown').lower()
+    }
+
+def fake_response(body: dict) -> dict:
+    requests = []
+    for message in body.get('input', []):
+        if message.get('role') != 'user':
+            continue
+        for part in message['content']:
+            if part.get('type') == 'input_text':
+                requests.append(json.loads(part['text']))
+
+    text = json.dumps({'requests': [fake_classification(r) for r in requests]})
+    input_tokens = len(json.dumps(body.get('input', []))) // 4
+    output_tokens = len(text) // 4
+    return {
+        'id': new_id('resp'),
+        'object': 'response',
+        'created_at': int(time.time()),
+        'status': 'completed',
+        'model': body.get('model'),
+        'output': [{
+            'id': new_id('msg'),
+            'type': 'message',
+            'role': 'assistant',
+            'status': 'completed',
+            'content': [{'type': 'output_text', 'text': text, 'annotations': []}]
+        }],
+        'parallel_tool_calls': True,
+        'tool_choice': 'auto',
+        'tools': [],
+        'usage': {
+            'input_tokens': input_tokens,
+            'input_tokens_details': {'cached_tokens': 0},
+            'output_tokens': output_tokens,
+            'output_tokens_details': {'reasoning_tokens': 0},
+            'total_tokens': input_tokens + output_tokens
+        }
+    }
+
+def store_file(filename: str, content: bytes, purpose: str) -> dict:
+    file = {
+        'id': new_id('file'),
+        'object': 'file',
+        'bytes': len(content),
+        'created_at': int(time.time()),
+        'filename': filename,
+        'purpose': purpose,
+        'status': 'processed'
+    }
+    files[file['id']] = {'meta': file, 'content': content}
+    return file
+
+def run_batch(batch: dict) -> None:
+    lines = files[batch['input_file_id']]['content'].decode().splitlines()
+    output = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        output.append(json.dumps({
+            'id': new_id('batch_req'),
+            'custom_id': record['custom_id'],
+            'response': {'status_code': 200, 'request_id': new_id('req'), 'body': fake_response(record['body'])},
+            'error': None
+        }))
+
+    output_file = store_file(f'{batch["id"]}_output.jsonl', '\n'.join(output).encode(), 'batch_output')
+    batch['status'] = 'completed'
+    batch['output_file_id'] = output_file['id']
+    batch['completed_at'] = int(time.time())
+    batch['request_counts'] = {'total': len(output), 'completed': len(output), 'failed': 0}
+
+@app.post('/v1/responses')
+async def create_response(request: Request):
+    body = await request.json()
+    response = fake_response(body)
+    classified = len(json.loads(response['output'][0]['content'][0]['text'])['requests'])
+
+    delay = LLM_LATENCY + LLM_LATENCY_PER_REQUEST * classified
+    delay *= 1 + random.uniform(-LLM_JITTER, LLM_JITTER)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return response
+
+@app.post('/v1/files')
+async def create_file(file: UploadFile, purpose: str = Form(...)):
+    return store_file(file.filename, await file.read(), purpose)
+
+@app.get('/v1/files/{file_id}/content', response_class=PlainTextResponse)
+async def file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(404, 'File not found')
+    return files[file_id]['content'].decode()
+
+@app.post('/v1/batches')
+async def create_batch(batch_in: BatchIn):
+    if batch_in.input_file_id not in files:
+        raise HTTPException(404, 'Input file not found')
+    batch = {
+        'id': new_id('batch'),
+        'object': 'batch',
+        'endpoint': batch_in.endpoint,
+        'input_file_id': batch_in.input_file_id,
+        'completion_window': batch_in.completion_window,
+        'status': 'in_progress',
+        'created_at': int(time.time()),
+        'output_file_id': None,
+        'error_file_id': None,
+        'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+        'metadata': batch_in.metadata
+    }
+    batches[batch['id']] = batch
+    return batch
+
+@app.get('/v1/batches/{batch_id}')
+async def get_batch(batch_id: str):
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(404, 'Batch not found')
+    if batch['status'] == 'in_progress' and time.time() - batch['created_at'] >= BATCH_DELAY:
+        run_batch(batch)
+    return batch